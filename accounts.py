@@ -0,0 +1,90 @@
+"""Sub-account: trade spot, posisi futures dan dompet futures di-scope dengan kolom `account_id`.
+
+Satu proses melayani semua akun. Mirror tabel dan ledger cost basis dibuat
+per akun saat pertama dipakai, sedangkan harga live dan riwayat harga tetap
+satu cache bersama per koin, jadi jumlah panggilan CoinGecko mengikuti
+jumlah koin unik, bukan akun x koin.
+"""
+import threading
+from collections import OrderedDict
+
+import analysis_engine as engine
+from table_sync import DEFAULT_ACCOUNT_ID, TableMirror, parse_trade_dates
+
+DEFAULT_ACCOUNTS = [{'id': DEFAULT_ACCOUNT_ID, 'name': 'Main'}]
+# Ringkasan per versi mirror yang disimpan, untuk sesi yang datanya tertinggal dari mirror
+SUMMARY_VERSIONS = 8
+
+
+def load_accounts(client):
+    """Daftar akun [{'id', 'name'}] dari tabel 'accounts'; tabel kosong berarti satu akun bawaan."""
+    rows = client.table('accounts').select("id, name").order('id').execute().data
+    return rows or list(DEFAULT_ACCOUNTS)
+
+
+def load_wallet_balances(client):
+    """Saldo dompet futures semua akun {account_id: balance} dalam satu query (satu baris per akun)."""
+    rows = client.table('futures_wallet').select("account_id, balance").execute().data
+    return {row['account_id']: float(row['balance']) for row in rows}
+
+
+class AccountBook:
+    """Mirror tabel dan ledger cost basis per akun, dipakai bersama semua sesi (atau oleh worker)."""
+
+    def __init__(self, client):
+        self.client = client
+        self._trades = {}
+        self._futures = {}
+        self._ledgers = {}
+        self._lock = threading.Lock()
+
+    def trades_mirror(self, account_id):
+        with self._lock:
+            if account_id not in self._trades:
+                self._trades[account_id] = TableMirror(
+                    self.client, 'spot_trades', transform=parse_trade_dates, filters={'account_id': account_id}
+                )
+            return self._trades[account_id]
+
+    def futures_mirror(self, account_id):
+        with self._lock:
+            if account_id not in self._futures:
+                self._futures[account_id] = TableMirror(
+                    self.client, 'futures_positions', filters={'account_id': account_id}
+                )
+            return self._futures[account_id]
+
+    def spot_summary(self, account_id, method, trades, version):
+        """Ringkasan cost basis akun untuk `trades` pada `version` mirror.
+
+        Ledger bersama hanya mengikuti versi mirror terkini, jadi hanya menerima
+        trade baru. Sesi yang `trades`-nya tertinggal dihitung terpisah sekali per
+        versi tanpa menyentuh ledger, sehingga tidak memicu replay seluruh riwayat.
+        """
+        with self._lock:
+            entry = self._ledgers.get((account_id, method))
+            if entry is None:
+                entry = self._ledgers[(account_id, method)] = {
+                    'ledger': engine.CostBasisLedger(method), 'summaries': OrderedDict(), 'lock': threading.Lock(),
+                }
+        with entry['lock']:
+            summaries = entry['summaries']
+            if version not in summaries:
+                if version == self.trades_mirror(account_id).state_key:
+                    entry['ledger'].sync(trades)
+                    summaries[version] = entry['ledger'].summary()
+                else:
+                    summaries[version] = engine.summarize_spot_holdings(trades, method)
+                while len(summaries) > SUMMARY_VERSIONS:
+                    summaries.popitem(last=False)
+            summaries.move_to_end(version)
+            return summaries[version]
+
+    def sync_all(self, account_ids):
+        """Sync bertahap mirror semua akun; mengembalikan {account_id: (trades, trades_version, positions)}."""
+        data = {}
+        for account_id in account_ids:
+            trades_mirror = self.trades_mirror(account_id)
+            trades = trades_mirror.sync()
+            data[account_id] = (trades, trades_mirror.state_key, self.futures_mirror(account_id).sync())
+        return data
@@ -1,65 +1,611 @@
+import os
+import numpy as np
 import pandas as pd
 import streamlit as st
-from datetime import datetime
-
-@st.cache_data
-def fetch_historical_data(_cg_client, coin_id, days):
-    try:
-        chart_data = _cg_client.get_coin_market_chart_by_id(
-            id=coin_id, 
-            vs_currency='usd', 
-            days=days
-        )
-        df = pd.DataFrame(chart_data['prices'], columns=['Timestamp', 'Price'])
-        df['Date'] = pd.to_datetime(df['Timestamp'], unit='ms').dt.date
-        daily_avg_df = df.groupby('Date')[['Price']].mean()
-        return daily_avg_df
-    except Exception as e:
-        st.error(f"Error fetching history for {coin_id}: {e}")
-        return pd.DataFrame()
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from instrumentation import metrics
+from market_data import fetch_concurrently
+from price_store import PriceStore, sync_intraday_history, sync_price_history, utc_today
+from snapshot_store import PortfolioSnapshotStore
+from table_sync import DEFAULT_ACCOUNT_ID, trade_fingerprints
+
+# Batas titik per seri grafik yang dikirim ke browser
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "1000"))
+
+@st.cache_resource
+def get_price_store():
+    # Satu store untuk semua sesi Streamlit; datanya tetap ada setelah restart.
+    return PriceStore()
+
+@st.cache_resource
+def get_snapshot_store(account_id=DEFAULT_ACCOUNT_ID):
+    # Snapshot harian per akun; harga (PriceStore) tetap satu untuk semua akun
+    return PortfolioSnapshotStore(account_id=account_id)
 
-def calculate_portfolio_history(trades_list, cg_client):
+def fetch_price_histories(cg_client, coins, days, read_from=None):
+    """Sinkronisasi riwayat harga banyak koin sekaligus secara paralel.
+
+    Koin yang gagal hanya memunculkan error; koin lain tetap dipakai. Harga
+    hari ini hanya diambil ulang setelah `OPEN_DAY_TTL` (lihat PriceStore).
+    Mengembalikan (price_histories, failed_coins). `read_from` membatasi
+    rentang yang dibaca dari store tanpa mengubah rentang yang disinkronkan.
+    """
+    store = get_price_store()
+    end_date = utc_today()
+    start_date = end_date - timedelta(days=days)
+    _, errors = fetch_concurrently(
+        lambda coin: sync_price_history(cg_client, store, coin, start_date, end_date), list(coins)
+    )
+    for coin, e in errors.items():
+        st.error(f"Error fetching history for {coin}: {e}")
+    read_start = max(start_date, read_from) if read_from else start_date
+    return {coin: store.read(coin, read_start, end_date) for coin in coins}, set(errors)
+
+def daily_trade_hashes(trades_df):
+    """Sidik jari trade per hari (Series date -> hex), untuk mendeteksi trade yang berubah."""
+    row_hashes = trade_fingerprints(trades_df, ('date', 'coin', 'amount'))
+    per_day = row_hashes.groupby(trades_df['date'].values).agg(
+        lambda h: int(h.to_numpy().sum(dtype='uint64'))
+    )
+    return per_day.map(lambda h: f"{h:016x}")
+
+def calculate_portfolio_history(trades_list, cg_client, with_matrices=False, account_id=DEFAULT_ACCOUNT_ID,
+                                matrices_from=None):
+    """Nilai portofolio spot harian ("Total Value") sejak trade pertama.
+
+    Snapshot harian yang tersimpan di-scope per `account_id`. Dengan `with_matrices=True` mengembalikan (history_df, holdings_df, prices_df):
+    matriks holding dan harga harian (date x coin) untuk seluruh rentang, atau
+    mulai `matrices_from` saja, dipakai oleh modul analytics.
+    """
     if not trades_list:
-        return pd.DataFrame()
+        return (pd.DataFrame(), pd.DataFrame(), pd.DataFrame()) if with_matrices else pd.DataFrame()
+    stages = metrics.stages("history")
 
-    # 1. Konversi list trade (dari DB) ke DataFrame
+    # 1. Konversi list trade (dari DB) ke DataFrame; jumlah Sell bernilai negatif
     trades_df = pd.DataFrame(trades_list)
-    # --- PERBAIKAN DI SINI ---
-    # Konversi objek 'date' (dari load_trades) ke datetime untuk pandas
-    trades_df['date'] = pd.to_datetime(trades_df['date'])
-    
-    # --- PERBAIKAN DI SINI ---
+    trades_df['date'] = pd.to_datetime(trades_df['date']).dt.date
+    trades_df['amount'] = pd.to_numeric(trades_df['amount'])
+    if 'type' in trades_df:
+        trades_df.loc[trades_df['type'] == 'Sell', 'amount'] *= -1
+
     start_date = trades_df['date'].min()
-    today = datetime.now()
+    today = datetime.now().date()
     days_since_start = (today - start_date).days + 2
     unique_coins = trades_df['coin'].unique()
+    stages.mark("prepare_trades")
 
-    # 2. Ambil semua riwayat harga
-    price_histories = {}
-    for coin in unique_coins:
-        price_histories[coin] = fetch_historical_data(cg_client, coin, days_since_start)
-
-    # 3. Buat DataFrame holding harian
-    all_days_index = pd.date_range(start=start_date, end=today, freq='D').date
-    holdings_df = pd.DataFrame(index=all_days_index, columns=unique_coins).fillna(0)
-
-    # --- PERBAIKAN DI SINI ---
-    # Hitung perubahan holding harian dari trade
-    trade_changes = trades_df.groupby(['date', 'coin'])['amount'].sum()
-    trade_changes = trade_changes.unstack(level='coin').reindex(all_days_index).fillna(0)
-    
-    # Hitung holding kumulatif (apa yang kita miliki setiap hari)
-    holdings_df = trade_changes.cumsum()
-
-    # 4. Buat DataFrame harga harian
-    prices_df = pd.DataFrame(index=all_days_index, columns=unique_coins).fillna(0)
+    # 2. Buang snapshot mulai dari hari pertama yang trade-nya berubah (insert/delete)
+    snapshots = get_snapshot_store(account_id)
+    day_hashes = daily_trade_hashes(trades_df)
+    changed_day = snapshots.first_changed_day(day_hashes)
+    if changed_day is not None:
+        snapshots.invalidate_from(changed_day)
+
+    last_day = snapshots.last_date()
+    if last_day is None:
+        compute_from = start_date
+        base_holdings = pd.Series(dtype=float)
+        seed_prices = pd.Series(dtype=float)
+    else:
+        compute_from = last_day + timedelta(days=1)
+        base_holdings = snapshots.holdings_on(last_day)
+        seed_prices = snapshots.prices_on(last_day)
+
+    materialized = snapshots.read_totals()
+    stages.mark("load_snapshots")
+    if compute_from > today:
+        stages.done()
+        history_df = materialized.to_frame(name="Total Value")
+        return (history_df, *snapshots.read_matrices(matrices_from)) if with_matrices else history_df
+
+    # 3. Ambil riwayat harga (hanya celah yang belum tersimpan yang ke API)
+    price_histories, failed_coins = fetch_price_histories(
+        cg_client, unique_coins, days_since_start, read_from=compute_from
+    )
+    stages.mark("fetch_prices")
+
+    # 4. Holding harian hanya untuk hari yang belum di-materialize
+    new_days = pd.date_range(start=compute_from, end=today, freq='D').date
+    new_trades = trades_df[trades_df['date'] >= compute_from]
+    trade_changes = new_trades.groupby(['date', 'coin'])['amount'].sum().unstack(level='coin')
+    trade_changes = trade_changes.reindex(index=new_days, columns=unique_coins).fillna(0)
+    holdings_df = trade_changes.cumsum() + base_holdings.reindex(unique_coins).fillna(0)
+    stages.mark("holdings")
+
+    # 5. Harga harian, di-ffill dari harga snapshot terakhir
+    prices_df = pd.DataFrame(0.0, index=new_days, columns=unique_coins)
     for coin in unique_coins:
-        if not price_histories[coin].empty:
-            prices_df[coin] = price_histories[coin]['Price'].reindex(all_days_index, method='ffill')
-
-    # 5. Hitung nilai portofolio
-    daily_value_df = holdings_df * prices_df
-    total_value_over_time = daily_value_df.sum(axis=1)
-    total_value_over_time = total_value_over_time.to_frame(name="Total Value")
-    
-    return total_value_over_time
+        history = price_histories[coin]
+        prices = history['Price'] if not history.empty else pd.Series(dtype=float)
+        if coin in seed_prices.index and last_day not in prices.index:
+            prices = pd.concat([pd.Series({last_day: seed_prices[coin]}), prices])
+        if not prices.empty:
+            prices_df[coin] = prices.reindex(new_days, method='ffill').fillna(0)
+
+    # 6. Nilai portofolio untuk hari baru
+    new_totals = (holdings_df * prices_df).sum(axis=1)
+    stages.mark("valuation")
+
+    # Hari yang sudah final (sebelum hari ini, UTC maupun lokal) disimpan sekali saja
+    final_days = [d for d in new_days if d < min(today, utc_today())]
+    if final_days and not failed_coins:
+        snapshots.append(
+            holdings_df.loc[final_days], prices_df.loc[final_days],
+            new_totals.loc[final_days], day_hashes,
+        )
+    stages.mark("persist_snapshots")
+
+    total_value_over_time = pd.concat([materialized, new_totals])
+    total_value_over_time.index.name = 'date'
+    history_df = total_value_over_time.to_frame(name="Total Value")
+    if with_matrices:
+        # Matriks tersimpan (tanpa hari yang baru saja ditulis) + matriks hari baru
+        stored_holdings, stored_prices = snapshots.read_matrices(matrices_from)
+        stored_holdings = stored_holdings[stored_holdings.index < compute_from]
+        stored_prices = stored_prices[stored_prices.index < compute_from]
+        if matrices_from is not None:
+            holdings_df = holdings_df[holdings_df.index >= matrices_from]
+            prices_df = prices_df[prices_df.index >= matrices_from]
+        holdings_all = pd.concat([stored_holdings, holdings_df]).fillna(0.0)
+        prices_all = pd.concat([stored_prices, prices_df.where(prices_df > 0)])
+        stages.done()
+        return history_df, holdings_all, prices_all
+    stages.done()
+    return history_df
+
+# Resolusi intraday yang didukung -> frekuensi pandas dan jendela bawaan (hari, None = sejak trade pertama)
+INTRADAY_RESOLUTIONS = {'1h': ('h', None), '5min': ('5min', 1)}
+RESAMPLE_RULES = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'ME'}
+
+def calculate_intraday_portfolio_history(trades_list, cg_client, resolution='1h', lookback_days=None):
+    """Nilai portofolio spot pada resolusi intraday ('1h' atau '5min').
+
+    Layout kolumnar yang ringkas: index datetime64 (UTC), matriks harga dan
+    holding float32 berukuran waktu x koin, dan koin dikodekan sebagai kategori.
+    Mengembalikan DataFrame dengan kolom "Total Value"; gunakan
+    resample_history() untuk tampilan harian/mingguan/bulanan.
+    """
+    if not trades_list:
+        return pd.DataFrame()
+    freq, default_lookback = INTRADAY_RESOLUTIONS[resolution]
+    stages = metrics.stages(f"intraday_history.{resolution}")
+    lookback_days = lookback_days if lookback_days is not None else default_lookback
+
+    trades_df = pd.DataFrame(trades_list)[['date', 'coin', 'type', 'amount']]
+    trade_ms = pd.to_datetime(trades_df['date']).dt.as_unit('ms').astype('int64').to_numpy()
+    amounts = pd.to_numeric(trades_df['amount']).to_numpy(dtype=np.float32)
+    amounts = np.where(trades_df['type'].to_numpy() == 'Sell', -amounts, amounts)
+    coin_codes = trades_df['coin'].astype('category')
+    coins = coin_codes.cat.categories
+    codes = coin_codes.cat.codes.to_numpy()
+
+    now = pd.Timestamp.now(tz='UTC').tz_localize(None).floor(freq)
+    start = pd.Timestamp(trade_ms.min(), unit='ms').floor(freq)
+    if lookback_days:
+        start = max(start, now - pd.Timedelta(days=lookback_days))
+    grid = pd.date_range(start=start, end=now, freq=freq)
+    grid_ms = grid.as_unit('ms').asi8
+    start_ts, end_ts = int(grid_ms[0] // 1000), int(grid_ms[-1] // 1000)
+    stages.mark("prepare_trades")
+
+    # 1. Harga: sinkronkan celah secara paralel, lalu ffill tiap koin ke grid dengan searchsorted
+    store = get_price_store()
+    _, errors = fetch_concurrently(
+        lambda coin: sync_intraday_history(cg_client, store, coin, resolution, start_ts - 86400, end_ts),
+        list(coins),
+    )
+    for coin, e in errors.items():
+        st.error(f"Error fetching intraday history for {coin}: {e}")
+    stages.mark("fetch_prices")
+    prices = np.zeros((len(grid), len(coins)), dtype=np.float32)
+    for j, coin in enumerate(coins):
+        ts, coin_prices = store.read_intraday(coin, start_ts - 86400, end_ts)
+        if len(ts):
+            idx = np.searchsorted(ts, grid_ms, side='right') - 1
+            prices[:, j] = np.where(idx >= 0, coin_prices[np.clip(idx, 0, None)], 0)
+    stages.mark("price_matrix")
+
+    # 2. Holding: perubahan per (waktu, koin) disebar ke grid, lalu cumsum di tempat
+    rows = np.searchsorted(grid_ms, trade_ms, side='right') - 1
+    holdings = np.zeros((len(grid), len(coins)), dtype=np.float32)
+    np.add.at(holdings, (np.clip(rows, 0, None), codes), amounts)
+    np.cumsum(holdings, axis=0, out=holdings)
+    stages.mark("holdings")
+
+    # 3. Nilai total tanpa membuat matriks perkalian sementara
+    total_value = np.einsum('ij,ij->i', holdings, prices, dtype=np.float64)
+    history_df = pd.DataFrame({"Total Value": total_value}, index=grid)
+    history_df.index.name = 'date'
+    stages.mark("valuation")
+    stages.done()
+    return history_df
+
+def resample_history(history_df, view):
+    """Resample riwayat ke 'Daily', 'Weekly' atau 'Monthly' (nilai akhir periode + titik terendah)."""
+    if history_df.empty or view not in RESAMPLE_RULES:
+        return history_df
+    index = pd.to_datetime(history_df.index)
+    resampled = history_df.set_axis(index)['Total Value'].resample(RESAMPLE_RULES[view]).agg(['last', 'min'])
+    resampled.columns = ["Total Value", "Low"]
+    resampled.index.name = 'date'
+    return resampled.dropna()
+
+def _position_arrays(pos_df, live_prices):
+    """Kolom posisi sebagai array float: (coin_ids, entry, margin, leverage, live, sign)."""
+    coin_ids = pos_df['coin_id'].to_numpy()
+    entry = pos_df['entry_price'].to_numpy(dtype=float)
+    margin = pos_df['margin'].to_numpy(dtype=float)
+    leverage = pos_df['leverage'].to_numpy(dtype=float)
+    if isinstance(live_prices, dict):
+        live = pos_df['coin_id'].map(live_prices).fillna(0).to_numpy(dtype=float)
+    else:
+        live = np.asarray(live_prices, dtype=float)
+    live = np.where(coin_ids == 'tether', 1.0, live)
+    # Long = +1, Short = -1; rumus Long/Short jadi satu tanpa percabangan
+    sign = np.where(pos_df['direction'].to_numpy() == 'Long', 1.0, -1.0)
+    return coin_ids, entry, margin, leverage, live, sign
+
+def calculate_futures_metrics(positions, live_prices):
+    """Menghitung Size, P/L, P/L % dan Liq. Price semua posisi futures dalam satu pass.
+
+    `positions` berupa list dict dari DB atau DataFrame dengan kolom id, coin_id,
+    direction, entry_price, margin, leverage. `live_prices` berupa dict
+    coin -> harga, atau array harga yang sejajar dengan baris posisi.
+    """
+    pos_df = positions if isinstance(positions, pd.DataFrame) else pd.DataFrame(positions)
+    if pos_df.empty:
+        return pd.DataFrame()
+
+    coin_ids, entry, margin, leverage, live, sign = _position_arrays(pos_df, live_prices)
+    size_usd = margin * leverage
+    size_coins = size_usd / entry
+    liq_price = entry * (1 - sign / leverage)
+    pnl_usd = sign * (live - entry) * size_coins
+    safe_margin = np.where(margin != 0, margin, 1.0)
+    pnl_perc = np.where(margin != 0, pnl_usd / safe_margin * 100, 0.0)
+
+    return pd.DataFrame({
+        "DB_ID": pos_df['id'].to_numpy(), "Coin": coin_ids, "Direction": pos_df['direction'].to_numpy(),
+        "Size (USD)": size_usd, "Margin": margin, "Leverage": pos_df['leverage'].astype(str).to_numpy() + "x",
+        "Entry Price": entry, "Live Price": live, "P/L (USD)": pnl_usd, "P/L (%)": pnl_perc,
+        "Liq. Price": liq_price,
+    })
+
+# Grid skenario bawaan: -50% s/d +50% per 0.5%
+STRESS_MAX_SHOCK = 0.5
+STRESS_STEP = 0.005
+
+def stress_shocks(max_shock=STRESS_MAX_SHOCK, step=STRESS_STEP):
+    n_steps = int(round(max_shock / step))
+    return np.arange(-n_steps, n_steps + 1) * step
+
+def futures_stress_test(positions, live_prices, futures_balance=0.0, shocks=None):
+    """Menilai semua posisi futures terhadap grid perubahan harga dalam satu komputasi broadcast.
+
+    `shocks` adalah perubahan relatif harga (mis. -0.1 = turun 10%) yang
+    diterapkan ke setiap koin kecuali tether. Harga dianggap bergerak lurus
+    dari harga live ke harga skenario, jadi posisi yang melewati Liq. Price
+    dianggap terlikuidasi dan kehilangan seluruh margin (isolated margin).
+
+    Mengembalikan dict berisi:
+      - scenarios: DataFrame per shock (Equity, P/L (USD), Liquidated, Margin Lost)
+      - liquidated: matriks bool shock x posisi (kolom = DB_ID)
+      - positions: Liq. Price dan jarak ke likuidasi (Liq. Move (%)) per posisi
+      - liquidation_map: margin (USD) yang terlikuidasi per koin x bucket shock
+    """
+    pos_df = positions if isinstance(positions, pd.DataFrame) else pd.DataFrame(positions)
+    shocks = stress_shocks() if shocks is None else np.asarray(shocks, dtype=float)
+    if pos_df.empty:
+        return {"scenarios": pd.DataFrame(), "liquidated": pd.DataFrame(),
+                "positions": pd.DataFrame(), "liquidation_map": pd.DataFrame()}
+
+    coin_ids, entry, margin, leverage, live, sign = _position_arrays(pos_df, live_prices)
+    size_coins = margin * leverage / entry
+    liq_price = entry * (1 - sign / leverage)
+    stable = coin_ids == 'tether'
+
+    # Matriks skenario x posisi: harga, P/L dan status likuidasi
+    moves = np.where(stable, 0.0, shocks[:, None])
+    prices = live * (1 + moves)
+    pnl = sign * (prices - entry) * size_coins
+    already_liquidated = sign * (live - liq_price) <= 0
+    liquidated = (sign * (prices - liq_price) <= 0) | already_liquidated
+    position_equity = np.where(liquidated, 0.0, margin + pnl)
+
+    equity = futures_balance + position_equity.sum(axis=1)
+    scenarios = pd.DataFrame({
+        "Equity": equity,
+        "P/L (USD)": equity - futures_balance - margin.sum(),
+        "Liquidated": liquidated.sum(axis=1),
+        "Margin Lost": (liquidated * margin).sum(axis=1),
+    }, index=pd.Index(np.round(shocks * 100, 4), name="Shock (%)"))
+
+    # Jarak ke likuidasi sebagai % pergerakan dari harga live (NaN untuk tether/tanpa harga)
+    safe_live = np.where(live > 0, live, np.nan)
+    liq_move = np.where(stable, np.nan, (liq_price / safe_live - 1) * 100)
+    positions_df = pd.DataFrame({
+        "DB_ID": pos_df['id'].to_numpy(), "Coin": coin_ids, "Direction": pos_df['direction'].to_numpy(),
+        "Margin": margin, "Live Price": live, "Liq. Price": liq_price, "Liq. Move (%)": liq_move,
+    })
+
+    # Heatmap: margin per koin di shock pertama (terdekat dari 0) yang melikuidasinya
+    coins = pd.Categorical(coin_ids)
+    shock_pct = shocks * 100
+    in_range = np.isfinite(liq_move) & (liq_move >= shock_pct[0]) & (liq_move <= shock_pct[-1])
+    moves_in_range = liq_move[in_range]
+    buckets = np.where(
+        moves_in_range > 0,
+        np.searchsorted(shock_pct, moves_in_range, side='left'),
+        np.searchsorted(shock_pct, moves_in_range, side='right') - 1,
+    )
+    heat = np.zeros((len(coins.categories), len(shocks)))
+    np.add.at(heat, (coins.codes[in_range], buckets), margin[in_range])
+    liquidation_map = pd.DataFrame(heat, index=pd.Index(coins.categories, name="Coin"), columns=scenarios.index)
+
+    return {
+        "scenarios": scenarios,
+        "liquidated": pd.DataFrame(liquidated, index=scenarios.index, columns=positions_df['DB_ID']),
+        "positions": positions_df,
+        "liquidation_map": liquidation_map,
+    }
+
+COST_BASIS_METHODS = ("Average", "FIFO", "LIFO")
+
+class CostBasisLedger:
+    """Lot pembelian per koin yang diproses urut (date, id), untuk FIFO, LIFO atau Average.
+
+    Setiap trade diproses tepat sekali, jadi total kerjanya O(n) atas log trade.
+    Trade baru yang tanggalnya tidak lebih awal dari trade terakhir cukup
+    di-`apply`; selain itu (trade dihapus/disisipkan di masa lalu) ledger dibangun ulang.
+    """
+
+    def __init__(self, method="Average"):
+        if method not in COST_BASIS_METHODS:
+            raise ValueError(f"Metode cost basis tidak dikenal: {method}")
+        self.method = method
+        self._reset()
+
+    def _reset(self):
+        self.lots = defaultdict(deque)
+        self.realized = defaultdict(float)
+        self.last_key = None
+        self.trade_ids = set()
+
+    def apply(self, trades_list):
+        """Memproses trade yang diurutkan berdasarkan (date, id)."""
+        trades = sorted(trades_list, key=lambda t: (t['date'], t.get('id', 0)))
+        for trade in trades:
+            coin = trade['coin']
+            amount = float(trade['amount'])
+            total = float(trade['total_cost_usd'])
+            if trade['type'] == 'Buy':
+                self._buy(coin, amount, total)
+            elif amount > 0:
+                self._sell(coin, amount, total)
+            self.trade_ids.add(trade.get('id'))
+        if trades:
+            last = trades[-1]
+            self.last_key = (last['date'], last.get('id', 0))
+
+    def _buy(self, coin, amount, total):
+        lots = self.lots[coin]
+        if self.method == "Average" and lots:
+            lots[0][0] += amount
+            lots[0][1] += total
+        else:
+            lots.append([amount, total])
+
+    def _sell(self, coin, amount, proceeds):
+        lots = self.lots[coin]
+        remaining = amount
+        cost = 0.0
+        while remaining > 1e-12 and lots:
+            lot = lots[-1] if self.method == "LIFO" else lots[0]
+            take = min(remaining, lot[0])
+            lot_cost = lot[1] * take / lot[0] if lot[0] else 0.0
+            lot[0] -= take
+            lot[1] -= lot_cost
+            cost += lot_cost
+            remaining -= take
+            if lot[0] <= 1e-12:
+                if self.method == "LIFO":
+                    lots.pop()
+                else:
+                    lots.popleft()
+        # Penjualan melebihi holding: hanya bagian yang punya cost basis yang direalisasi
+        sold = amount - remaining
+        self.realized[coin] += proceeds * sold / amount - cost
+
+    def sync(self, trades_list):
+        """Menerapkan trade baru secara inkremental, atau membangun ulang bila perlu.
+
+        Mengembalikan True jika ledger dibangun ulang dari awal.
+        """
+        current_ids = {t.get('id') for t in trades_list}
+        new_trades = [t for t in trades_list if t.get('id') not in self.trade_ids]
+        removed = bool(self.trade_ids - current_ids)
+        out_of_order = self.last_key is not None and any(
+            (t['date'], t.get('id', 0)) < self.last_key for t in new_trades
+        )
+        if removed or out_of_order:
+            self._reset()
+            self.apply(trades_list)
+            return True
+        self.apply(new_trades)
+        return False
+
+    def summary(self):
+        """DataFrame per koin: Holdings, Avg. Buy Price, Cost Basis (USD), Realized P/L (USD)."""
+        coins = sorted(set(self.lots) | set(self.realized))
+        holdings = np.array([sum(lot[0] for lot in self.lots[c]) for c in coins], dtype=float)
+        cost = np.array([sum(lot[1] for lot in self.lots[c]) for c in coins], dtype=float)
+        summary_df = pd.DataFrame({
+            "Holdings": holdings,
+            "Avg. Buy Price": np.divide(cost, holdings, out=np.zeros_like(cost), where=holdings > 0.000001),
+            "Cost Basis (USD)": cost,
+            "Realized P/L (USD)": [self.realized.get(c, 0.0) for c in coins],
+        }, index=pd.Index(coins, name='coin'))
+        keep = (summary_df['Holdings'] > 0.000001) | (summary_df['Realized P/L (USD)'] != 0)
+        return summary_df[keep]
+
+def summarize_spot_holdings(trades_list, method="Average"):
+    """Holding, Avg. Buy Price dan Realized P/L per koin dari daftar trade spot."""
+    ledger = CostBasisLedger(method)
+    ledger.apply(trades_list)
+    return ledger.summary()
+
+def value_spot_holdings(summary_df, live_prices):
+    """Menambahkan Live Price, Current Value dan Unrealized P/L ke hasil summarize_spot_holdings."""
+    summary_df = summary_df.copy()
+    summary_df['Live Price'] = summary_df.index.map(lambda coin: live_prices.get(coin, 0))
+    summary_df['Current Value (USD)'] = summary_df['Holdings'] * summary_df['Live Price']
+    summary_df['Unrealized P/L (USD)'] = summary_df['Current Value (USD)'] - summary_df['Cost Basis (USD)']
+    return summary_df
+
+def dashboard_coins(summary_df, positions):
+    """Koin yang butuh harga live: holding spot, posisi futures, dan tether."""
+    held = summary_df.index[summary_df['Holdings'] > 0.000001] if not summary_df.empty else []
+    coins = set(held) | {pos['coin_id'] for pos in positions}
+    return sorted(coins | {'tether'})
+
+def calculate_dashboard(summary_df, positions, futures_balance, live_prices):
+    """Semua angka dashboard (spot, futures, total) dari input eksplisit, tanpa I/O."""
+    total_spot_value = 0.0; total_spot_pl = 0.0
+    total_futures_margin_used = 0.0; total_futures_pnl = 0.0
+    futures_df = pd.DataFrame()
+
+    if not summary_df.empty:
+        summary_df = value_spot_holdings(summary_df, live_prices)
+        total_spot_value = summary_df['Current Value (USD)'].sum()
+        total_spot_pl = summary_df['Unrealized P/L (USD)'].sum() + summary_df['Realized P/L (USD)'].sum()
+
+    if positions:
+        futures_df = calculate_futures_metrics(positions, live_prices)
+        total_futures_margin_used = futures_df['Margin'].sum()
+        total_futures_pnl = futures_df['P/L (USD)'].sum()
+
+    total_futures_equity = futures_balance + total_futures_margin_used + total_futures_pnl
+    return {
+        "summary_df": summary_df, "futures_df": futures_df,
+        "total_spot_value": total_spot_value, "total_spot_pl": total_spot_pl,
+        "available_futures_balance": futures_balance,
+        "total_futures_margin_used": total_futures_margin_used, "total_futures_pnl": total_futures_pnl,
+        "total_futures_equity": total_futures_equity, "grand_total": total_spot_value + total_futures_equity,
+    }
+
+def calculate_consolidated(summaries, positions, futures_balances, live_prices):
+    """Dashboard gabungan semua akun dalam satu pass vektor, tanpa loop per akun.
+
+    `summaries`: dict account_id -> hasil CostBasisLedger.summary(); `positions`:
+    posisi futures semua akun (dengan kolom account_id); `futures_balances`: dict
+    account_id -> saldo dompet. Angka per akun sama dengan `calculate_dashboard`.
+    Mengembalikan accounts_df (per akun), coins_df (exposure per koin) dan totalnya.
+    """
+    spot_parts = {account: df for account, df in summaries.items() if not df.empty}
+    if spot_parts:
+        spot_df = pd.concat(spot_parts, names=['account_id', 'coin'])
+    else:
+        spot_df = pd.DataFrame(
+            {'Holdings': [], 'Cost Basis (USD)': [], 'Realized P/L (USD)': []},
+            index=pd.MultiIndex.from_arrays([[], []], names=['account_id', 'coin']), dtype=float,
+        )
+    spot_coins = spot_df.index.get_level_values('coin')
+    holdings = spot_df['Holdings'].to_numpy(dtype=float)
+    spot_value = holdings * spot_coins.map(live_prices).fillna(0).to_numpy(dtype=float)
+    spot_long = pd.DataFrame({
+        'account_id': spot_df.index.get_level_values('account_id'), 'coin': spot_coins,
+        'Spot Holdings': holdings, 'Spot Value (USD)': spot_value,
+        'Spot P/L (USD)': spot_value - spot_df['Cost Basis (USD)'].to_numpy(dtype=float)
+                          + spot_df['Realized P/L (USD)'].to_numpy(dtype=float),
+    })
+
+    # Semua posisi semua akun dinilai sekaligus
+    pos_df = pd.DataFrame(positions, columns=['id', 'account_id', 'coin_id', 'direction', 'entry_price', 'margin', 'leverage'])
+    futures_df = calculate_futures_metrics(pos_df, live_prices)
+    if futures_df.empty:
+        futures_long = pd.DataFrame(columns=['account_id', 'coin', 'Margin', 'P/L (USD)', 'Net Futures (USD)'], dtype=float)
+    else:
+        sign = np.where(futures_df['Direction'] == 'Long', 1.0, -1.0)
+        futures_long = pd.DataFrame({
+            'account_id': pos_df['account_id'].to_numpy(), 'coin': futures_df['Coin'],
+            'Margin': futures_df['Margin'], 'P/L (USD)': futures_df['P/L (USD)'],
+            # Nilai nosional saat ini: + untuk Long, - untuk Short
+            'Net Futures (USD)': sign * futures_df['Size (USD)'] / futures_df['Entry Price'] * futures_df['Live Price'],
+        })
+
+    accounts = pd.Index(
+        sorted(set(summaries) | set(futures_balances) | set(futures_long['account_id'])), name='account_id'
+    )
+    spot_by_account = spot_long.groupby('account_id')[['Spot Value (USD)', 'Spot P/L (USD)']].sum().reindex(accounts, fill_value=0.0)
+    futures_by_account = futures_long.groupby('account_id')[['Margin', 'P/L (USD)']].sum().reindex(accounts, fill_value=0.0)
+    accounts_df = pd.DataFrame({
+        'Spot Value (USD)': spot_by_account['Spot Value (USD)'],
+        'Spot P/L (USD)': spot_by_account['Spot P/L (USD)'],
+        'Wallet (USD)': pd.Series(futures_balances, dtype=float).reindex(accounts, fill_value=0.0),
+        'Futures Margin (USD)': futures_by_account['Margin'],
+        'Futures P/L (USD)': futures_by_account['P/L (USD)'],
+    }, index=accounts).astype(float)
+    accounts_df['Futures Equity (USD)'] = accounts_df[['Wallet (USD)', 'Futures Margin (USD)', 'Futures P/L (USD)']].sum(axis=1)
+    accounts_df['Total Equity (USD)'] = accounts_df['Spot Value (USD)'] + accounts_df['Futures Equity (USD)']
+
+    exposure = pd.concat([spot_long[['account_id', 'coin']], futures_long[['account_id', 'coin']]])
+    coins_df = pd.concat([
+        spot_long.groupby('coin')[['Spot Holdings', 'Spot Value (USD)']].sum(),
+        futures_long.groupby('coin')[['Net Futures (USD)', 'P/L (USD)']].sum().rename(columns={'P/L (USD)': 'Futures P/L (USD)'}),
+    ], axis=1).astype(float).fillna(0.0)
+    coins_df['Net Exposure (USD)'] = coins_df['Spot Value (USD)'] + coins_df['Net Futures (USD)']
+    coins_df['Accounts'] = exposure.groupby('coin')['account_id'].nunique().reindex(coins_df.index).fillna(0).astype(int)
+    coins_df.index.name = 'coin'
+
+    return {
+        "accounts_df": accounts_df,
+        "coins_df": coins_df.sort_values('Net Exposure (USD)', ascending=False),
+        "total_spot_value": accounts_df['Spot Value (USD)'].sum(),
+        "total_futures_equity": accounts_df['Futures Equity (USD)'].sum(),
+        "total_pl": (accounts_df['Spot P/L (USD)'] + accounts_df['Futures P/L (USD)']).sum(),
+        "grand_total": accounts_df['Total Equity (USD)'].sum(),
+    }
+
+def _lttb_indices(xs, ys, n_out):
+    """Indeks titik terpilih menurut Largest-Triangle-Three-Buckets."""
+    n = len(xs)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Titik pertama & terakhir selalu dipakai; sisanya dibagi ke n_out - 2 bucket
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[end:next_end].mean()
+        avg_y = ys[end:next_end].mean()
+        area = np.abs(
+            (xs[a] - avg_x) * (ys[start:end] - ys[a]) - (xs[a] - xs[start:end]) * (avg_y - ys[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def downsample_lttb(df, y, x=None, max_points=CHART_MAX_POINTS):
+    """Memangkas seri grafik ke paling banyak `max_points` titik per seri dengan LTTB.
+
+    Puncak dan lembah tetap terjaga karena tiap bucket memilih titik yang
+    membentuk segitiga terbesar. `y` boleh satu kolom atau list kolom; tiap
+    kolom dipilih sendiri dan yang dikembalikan gabungan barisnya, jadi puncak
+    semua seri yang digambar ikut terjaga. `x` adalah nama kolom; None berarti index.
+    """
+    if df.empty or len(df) <= max_points:
+        return df
+    x_values = df.index if x is None else df[x]
+    if not pd.api.types.is_numeric_dtype(x_values):
+        x_values = pd.to_datetime(x_values).astype('int64')
+    xs = np.asarray(x_values, dtype=float)
+    selected = []
+    for column in ([y] if isinstance(y, str) else y):
+        ys = df[column].to_numpy(dtype=float)
+        rows = np.flatnonzero(~np.isnan(ys))
+        selected.append(rows[_lttb_indices(xs[rows], ys[rows], max_points)])
+    return df.iloc[np.unique(np.concatenate(selected))]
@@ -0,0 +1,216 @@
+"""Analitik risiko & performa portofolio spot dari matriks holding dan harga harian.
+
+Return harian dihitung dari perubahan harga atas holding awal hari
+(h[t-1] * (p[t] - p[t-1]) / V[t-1]), sehingga pembelian/penjualan tidak
+terhitung sebagai return. Semua statistik divektorkan; `AnalyticsState`
+menyimpan agregat berjalan sehingga hari baru cukup ditambahkan.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from table_sync import trade_fingerprints
+
+# Kripto diperdagangkan setiap hari
+PERIODS_PER_YEAR = 365
+DEFAULT_WINDOW = 30
+
+
+def trades_key(trades_list):
+    """Sidik jari seluruh set trade (urutan tidak berpengaruh), untuk kunci cache analitik."""
+    if not trades_list:
+        return "empty"
+    row_hashes = trade_fingerprints(pd.DataFrame(trades_list), ('date', 'coin', 'type', 'amount')).to_numpy()
+    return f"{int(row_hashes.sum(dtype='uint64')):016x}:{len(row_hashes)}"
+
+
+def position_returns(holdings_df, prices_df, prev_holdings=None, prev_prices=None):
+    """Return harian portofolio dan kontribusi per koin.
+
+    `prev_holdings`/`prev_prices` (Series per koin) adalah hari sebelum baris
+    pertama; tanpa itu baris pertama hanya menjadi titik awal. Mengembalikan
+    (returns Series, contribution DataFrame, pnl DataFrame).
+    """
+    coins = holdings_df.columns
+    prices = prices_df.reindex(columns=coins).ffill()
+    holdings = holdings_df
+    if prev_holdings is not None:
+        start_prices = prev_prices.reindex(coins)
+        prices = prices.fillna(start_prices) if len(prices) else prices
+        h_prev = pd.concat([prev_holdings.reindex(coins).fillna(0.0).to_frame().T, holdings.iloc[:-1]])
+        p_prev = pd.concat([start_prices.to_frame().T, prices.iloc[:-1]])
+        index = holdings.index
+    else:
+        h_prev, p_prev = holdings.iloc[:-1], prices.iloc[:-1]
+        index = holdings.index[1:]
+        prices = prices.iloc[1:]
+
+    h_prev = h_prev.to_numpy(dtype=float)
+    p_prev = p_prev.to_numpy(dtype=float)
+    p_now = prices.to_numpy(dtype=float)
+    # Koin tanpa holding kemarin tidak berkontribusi, walau harganya tidak diketahui
+    held = h_prev != 0
+    pnl = np.where(held, h_prev * (np.nan_to_num(p_now - p_prev)), 0.0)
+    start_value = np.where(held, h_prev * np.nan_to_num(p_prev), 0.0).sum(axis=1)
+    safe_value = np.where(start_value > 0, start_value, np.nan)
+    contribution = pnl / safe_value[:, None]
+
+    returns = pd.Series(np.nan_to_num(contribution.sum(axis=1)), index=index, name="Return")
+    contribution_df = pd.DataFrame(np.nan_to_num(contribution), index=index, columns=coins)
+    pnl_df = pd.DataFrame(pnl, index=index, columns=coins)
+    return returns, contribution_df, pnl_df
+
+
+def _underwater_runs(underwater, carry):
+    """Panjang deret hari di bawah puncak yang sedang berjalan, meneruskan `carry` dari batch sebelumnya."""
+    idx = np.arange(len(underwater))
+    last_reset = np.maximum.accumulate(np.where(underwater, -1, idx))
+    runs = np.where(last_reset < 0, idx + 1 + carry, idx - last_reset)
+    return np.where(underwater, runs, 0)
+
+
+class AnalyticsState:
+    """Agregat berjalan untuk satu set trade; hari final ditambahkan secara inkremental.
+
+    Baris terakhir (hari ini) selalu dianggap sementara: ikut dihitung di
+    `report()` tetapi tidak disimpan ke agregat, karena harganya masih berubah.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, risk_free_rate=0.0):
+        self.window = window
+        self.risk_free_rate = risk_free_rate
+        self.last_date = None
+        self.last_holdings = None
+        self.last_prices = None
+        self.returns = pd.Series(dtype=float, name="Return")
+        self.contribution = pd.DataFrame(dtype=float)
+        self.pnl = pd.DataFrame(dtype=float)
+        self.prices = pd.DataFrame(dtype=float)
+        self.agg = {'n': 0, 'sum': 0.0, 'sumsq': 0.0, 'downside_sumsq': 0.0, 'wealth': 1.0,
+                    'peak': 1.0, 'max_drawdown': 0.0, 'run': 0, 'max_run': 0}
+        self._provisional = None
+        self._lock = threading.Lock()
+
+    def _period_rf(self):
+        return (1 + self.risk_free_rate) ** (1 / PERIODS_PER_YEAR) - 1
+
+    def _extend(self, agg, returns):
+        """Agregat baru setelah menambahkan array `returns` (tanpa mengubah `agg`)."""
+        if not len(returns):
+            return dict(agg)
+        excess = returns - self._period_rf()
+        wealth = agg['wealth'] * np.cumprod(1 + returns)
+        peak = np.maximum.accumulate(np.maximum(wealth, agg['peak']))
+        drawdown = wealth / peak - 1
+        runs = _underwater_runs(drawdown < 0, agg['run'])
+        return {
+            'n': agg['n'] + len(returns),
+            'sum': agg['sum'] + excess.sum(),
+            'sumsq': agg['sumsq'] + (excess ** 2).sum(),
+            'downside_sumsq': agg['downside_sumsq'] + (np.minimum(excess, 0) ** 2).sum(),
+            'wealth': wealth[-1],
+            'peak': peak[-1],
+            'max_drawdown': min(agg['max_drawdown'], drawdown.min()),
+            'run': int(runs[-1]),
+            'max_run': max(agg['max_run'], int(runs.max())),
+        }
+
+    def update(self, holdings_df, prices_df):
+        """Menambahkan hari setelah `last_date`; baris terakhir disimpan sebagai data sementara."""
+        with self._lock:
+            return self._update(holdings_df, prices_df)
+
+    def _update(self, holdings_df, prices_df):
+        if holdings_df.empty:
+            return self
+        if self.last_date is not None:
+            holdings_df = holdings_df[holdings_df.index > self.last_date]
+            prices_df = prices_df[prices_df.index > self.last_date]
+            if holdings_df.empty:
+                self._provisional = None
+                return self
+            # Matriks boleh hanya berisi hari baru: koin yang dipegang kemarin tetap jadi kolom
+            coins = holdings_df.columns.union(self.last_holdings.index)
+            holdings_df = holdings_df.reindex(columns=coins, fill_value=0.0)
+            prices_df = prices_df.reindex(columns=coins)
+            returns, contribution, pnl = position_returns(holdings_df, prices_df, self.last_holdings, self.last_prices)
+        else:
+            returns, contribution, pnl = position_returns(holdings_df, prices_df)
+        prices = prices_df.reindex(columns=holdings_df.columns)
+
+        final = returns.index[:-1] if returns.index[-1:].equals(holdings_df.index[-1:]) else returns.index
+        if len(final):
+            self.agg = self._extend(self.agg, returns.loc[final].to_numpy())
+            self.returns = pd.concat([self.returns, returns.loc[final]])
+            self.contribution = pd.concat([self.contribution, contribution.loc[final]]).fillna(0.0)
+            self.pnl = pd.concat([self.pnl, pnl.loc[final]]).fillna(0.0)
+        final_rows = holdings_df.index[:-1]
+        if len(final_rows):
+            last = final_rows[-1]
+            self.prices = pd.concat([self.prices, prices.loc[final_rows]])
+            self.last_date = last
+            self.last_holdings = holdings_df.loc[last]
+            self.last_prices = self.prices.ffill().iloc[-1]
+        elif self.last_date is None:
+            return self
+        provisional_day = holdings_df.index[-1]
+        self._provisional = (
+            returns.loc[[provisional_day]] if provisional_day in returns.index else returns.iloc[:0],
+            contribution.loc[[provisional_day]] if provisional_day in contribution.index else contribution.iloc[:0],
+            pnl.loc[[provisional_day]] if provisional_day in pnl.index else pnl.iloc[:0],
+            prices.loc[[provisional_day]],
+        )
+        return self
+
+    def report(self):
+        """Semua metrik untuk data tersimpan + hari sementara."""
+        with self._lock:
+            returns, contribution, pnl, prices = self.returns, self.contribution, self.pnl, self.prices
+            agg, provisional = self.agg, self._provisional
+        if provisional is not None:
+            p_returns, p_contribution, p_pnl, p_prices = provisional
+            agg = self._extend(agg, p_returns.to_numpy())
+            returns = pd.concat([returns, p_returns])
+            contribution = pd.concat([contribution, p_contribution]).fillna(0.0)
+            pnl = pd.concat([pnl, p_pnl]).fillna(0.0)
+            prices = pd.concat([prices, p_prices])
+        if returns.empty:
+            return {}
+
+        n = agg['n']
+        mean = agg['sum'] / n
+        std = np.sqrt(max(agg['sumsq'] / n - mean ** 2, 0.0) * n / max(n - 1, 1))
+        downside = np.sqrt(agg['downside_sumsq'] / n)
+        annualize = np.sqrt(PERIODS_PER_YEAR)
+
+        wealth = (1 + returns).cumprod()
+        series_df = pd.DataFrame({
+            "Return": returns,
+            "Cumulative Return": wealth - 1,
+            "Drawdown": wealth / np.maximum.accumulate(np.maximum(wealth, 1.0)) - 1,
+            "Rolling Volatility": returns.rolling(self.window, min_periods=2).std() * annualize,
+        })
+        series_df.index.name = 'date'
+
+        coin_df = pd.DataFrame({
+            "Return Contribution": contribution.sum(),
+            "P/L (USD)": pnl.sum(),
+        })
+        coin_df.index.name = 'coin'
+        coin_returns = prices.ffill().pct_change(fill_method=None).tail(self.window)
+        coin_returns = coin_returns.loc[:, coin_returns.count() >= 2]
+
+        return {
+            "series": series_df,
+            "total_return": agg['wealth'] - 1,
+            "volatility": std * annualize,
+            "sharpe": mean / std * annualize if std > 0 else np.nan,
+            "sortino": mean / downside * annualize if downside > 0 else np.nan,
+            "max_drawdown": agg['max_drawdown'],
+            "max_drawdown_days": agg['max_run'],
+            "current_drawdown": agg['wealth'] / agg['peak'] - 1,
+            "current_drawdown_days": agg['run'],
+            "contribution": coin_df.sort_values("Return Contribution", ascending=False),
+            "correlation": coin_returns.corr(),
+        }
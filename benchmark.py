@@ -0,0 +1,298 @@
+"""Benchmark offline untuk jalur-jalur berat aplikasi.
+
+Memakai FakeCoinGecko dan LocalSupabase(':memory:') sehingga tidak butuh jaringan maupun kunci API.
+
+    python benchmark.py                 # ukuran cepat
+    python benchmark.py --full          # kurva penuh: 1k-1M trade, 10-1000 koin, 1-1000 posisi, 10-200 akun
+    python benchmark.py --only futures  # satu kelompok saja
+    python benchmark.py --only startup  # cold start aplikasi; exit 1 jika melebihi STARTUP_BUDGET
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Store harga/snapshot harus diarahkan ke folder sementara sebelum modul aplikasi di-import.
+_BENCH_DIR = tempfile.mkdtemp(prefix="crypto-tracker-bench-")
+os.environ["PRICE_STORE_PATH"] = os.path.join(_BENCH_DIR, "price_store.sqlite3")
+
+import numpy as np
+import pandas as pd
+import streamlit.logger
+
+import analysis_engine as engine
+import market_data
+from fake_clients import FakeCoinGecko
+from local_supabase import LocalSupabase
+from table_sync import TableMirror, parse_trade_dates
+from trade_import import import_trades
+
+streamlit.logger.set_log_level("error")
+
+# Budget waktu sampai kerangka halaman tampil pada proses baru (detik)
+STARTUP_BUDGET = float(os.environ.get("STARTUP_BUDGET", "0.5"))
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tanpa kuota: yang diukur adalah kode kita, bukan rate limiter.
+market_data.coingecko_limiter = market_data.TokenBucket(10**9, burst=10**9)
+
+QUICK_SIZES = {
+    'trades': [1_000, 10_000, 100_000],
+    'coins': [10, 100],
+    'positions': [1, 10, 100, 1000],
+    'sync_rows': [1_000, 10_000],
+    'import_rows': [10_000, 200_000],
+    'accounts': [10, 50],
+}
+FULL_SIZES = {
+    'trades': [1_000, 10_000, 100_000, 1_000_000],
+    'coins': [10, 100, 1000],
+    'positions': [1, 10, 100, 1000],
+    'sync_rows': [1_000, 10_000, 100_000],
+    'import_rows': [10_000, 200_000, 1_000_000],
+    'accounts': [10, 50, 200],
+}
+
+
+def make_trades(n_trades, n_coins, days=3 * 365, seed=0):
+    rng = np.random.default_rng(seed)
+    start = date.today() - timedelta(days=days)
+    offsets = np.sort(rng.integers(0, days, n_trades))
+    coins = rng.integers(0, n_coins, n_trades)
+    amounts = rng.uniform(0.01, 5, n_trades).round(8)
+    prices = rng.uniform(1, 50_000, n_trades).round(4)
+    # Sekitar 1 dari 4 trade adalah Sell, dengan jumlah lebih kecil agar holding tetap positif
+    is_sell = rng.random(n_trades) < 0.25
+    amounts = np.where(is_sell, amounts * 0.3, amounts)
+    return [
+        {
+            'id': i + 1, 'date': start + timedelta(days=int(o)), 'coin': f"coin-{c}",
+            'type': 'Sell' if s else 'Buy', 'amount': float(a), 'price_per_coin': float(p),
+            'total_cost_usd': float(a * p),
+        }
+        for i, (o, c, a, p, s) in enumerate(zip(offsets, coins, amounts, prices, is_sell))
+    ]
+
+
+def make_positions(n_positions, n_coins=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'id': i + 1, 'coin_id': 'tether' if i % 50 == 0 else f"coin-{rng.integers(0, n_coins)}",
+            'direction': 'Long' if rng.random() < 0.5 else 'Short',
+            'entry_price': float(rng.uniform(1, 50_000)), 'margin': float(rng.uniform(0, 1000)),
+            'leverage': int(rng.integers(1, 126)),
+        }
+        for i in range(n_positions)
+    ]
+
+
+def timed(fn, repeat=3):
+    """Waktu terbaik dari beberapa kali percobaan (detik)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def reset_local_stores():
+    engine.get_price_store.clear()
+    engine.get_snapshot_store.clear()
+    for name in os.listdir(_BENCH_DIR):
+        os.remove(os.path.join(_BENCH_DIR, name))
+
+
+def report(group, label, seconds, extra=""):
+    print(f"{group:<18} {label:<28} {seconds * 1000:>12.2f} ms  {extra}")
+
+
+def bench_spot_summary(sizes, latency):
+    price_data = FakeCoinGecko().get_price([f"coin-{i}" for i in range(50)], 'usd')
+    live = {coin: data['usd'] for coin, data in price_data.items()}
+    for n in sizes['trades']:
+        trades = make_trades(n, 50)
+
+        def run():
+            summary = engine.summarize_spot_holdings(trades)
+            return engine.value_spot_holdings(summary, live)
+        seconds, _ = timed(run)
+        report("spot_summary", f"trades={n:,}", seconds)
+
+        ledger = engine.CostBasisLedger("FIFO")
+        ledger.sync(trades[:-1])
+        seconds, _ = timed(lambda: ledger.sync(trades), repeat=1)
+        report("cost_basis", f"trades={n:,} append 1", seconds)
+
+
+def bench_futures(sizes, latency):
+    live = {f"coin-{i}": 100.0 + i for i in range(20)}
+    for n in sizes['positions']:
+        positions = make_positions(n)
+        seconds, _ = timed(lambda: engine.calculate_futures_metrics(positions, live))
+        report("futures_metrics", f"positions={n:,}", seconds)
+        shocks = engine.stress_shocks(step=0.0005)
+        seconds, _ = timed(lambda: engine.futures_stress_test(positions, live, 1000.0, shocks))
+        report("futures_stress", f"positions={n:,} x {len(shocks):,}", seconds)
+
+
+def bench_portfolio_history(sizes, latency):
+    n_trades = sizes['trades'][min(1, len(sizes['trades']) - 1)]
+    for n_coins in sizes['coins']:
+        trades = make_trades(n_trades, n_coins)
+        cg = FakeCoinGecko(latency=latency)
+        reset_local_stores()
+        cold, _ = timed(lambda: engine.calculate_portfolio_history(trades, cg), repeat=1)
+        cold_calls = cg.calls
+        warm, _ = timed(lambda: engine.calculate_portfolio_history(trades, cg), repeat=1)
+        label = f"coins={n_coins:,} trades={n_trades:,}"
+        report("portfolio_history", label + " cold", cold, f"api_calls={cold_calls}")
+        report("portfolio_history", label + " warm", warm, f"api_calls={cg.calls - cold_calls}")
+    for n in sizes['trades']:
+        trades = make_trades(n, 50)
+        cg = FakeCoinGecko(latency=latency)
+        reset_local_stores()
+        cold, _ = timed(lambda: engine.calculate_portfolio_history(trades, cg), repeat=1)
+        report("portfolio_history", f"trades={n:,} coins=50 cold", cold)
+
+
+def bench_table_sync(sizes, latency):
+    for n in sizes['sync_rows']:
+        db = LocalSupabase(':memory:', latency=latency)
+        db.seed('spot_trades', [dict(t, date=t['date'].isoformat()) for t in make_trades(n, 50)])
+        mirror = TableMirror(db, 'spot_trades', transform=parse_trade_dates)
+        cold, _ = timed(mirror.sync, repeat=1)
+        cold_calls = db.calls
+        warm, _ = timed(mirror.sync, repeat=1)
+        report("table_sync", f"rows={n:,} cold", cold, f"round_trips={cold_calls}")
+        report("table_sync", f"rows={n:,} warm", warm, f"round_trips={db.calls - cold_calls}")
+
+
+def bench_trade_import(sizes, latency):
+    for n in sizes['import_rows']:
+        trades = make_trades(n, 50)
+        csv_text = pd.DataFrame(trades).drop(columns='id').to_csv(index=False)
+        # Koin sintetis bukan simbol exchange; petakan ke dirinya sendiri agar tidak ditolak
+        symbol_map = {coin: coin for coin in {t['coin'] for t in trades}}
+        db = LocalSupabase(':memory:', latency=latency)
+        cold, (stats, _) = timed(lambda: import_trades(db, io.StringIO(csv_text), 'trades.csv', [], symbol_map=symbol_map), repeat=1)
+        report("trade_import", f"rows={n:,}", cold, f"inserted={stats['inserted']:,} round_trips={db.calls}")
+        existing = db.rows('spot_trades')
+        again, (stats, _) = timed(lambda: import_trades(db, io.StringIO(csv_text), 'trades.csv', existing), repeat=1)
+        report("trade_import", f"rows={n:,} re-import", again, f"duplicates={stats['duplicates']:,}")
+
+
+def bench_accounts(sizes, latency):
+    for n_accounts in sizes['accounts']:
+        summaries, positions, balances = {}, [], {}
+        for account_id in range(1, n_accounts + 1):
+            summaries[account_id] = engine.summarize_spot_holdings(make_trades(1_000, 50, seed=account_id))
+            positions += [dict(pos, account_id=account_id) for pos in make_positions(20, seed=account_id)]
+            balances[account_id] = 1000.0
+        coins = sorted({coin for df in summaries.values() for coin in df.index} | {pos['coin_id'] for pos in positions})
+
+        # Harga live: satu cache bersama, jadi panggilan API mengikuti koin unik, bukan akun x koin
+        cg = FakeCoinGecko(latency=latency)
+        cache = market_data.LivePriceCache(lambda batch: market_data.fetch_live_prices(cg, batch))
+        label = f"accounts={n_accounts:,} coins={len(coins):,}"
+        seconds, _ = timed(lambda: [
+            cache.get_prices(engine.dashboard_coins(summaries[a], [p for p in positions if p['account_id'] == a]))
+            for a in summaries
+        ], repeat=1)
+        report("accounts", label + " live prices", seconds, f"api_calls={cg.calls}")
+        live = cache.get_prices(coins)
+
+        per_account, _ = timed(lambda: [
+            engine.calculate_dashboard(summaries[a], [p for p in positions if p['account_id'] == a], balances[a], live)
+            for a in summaries
+        ])
+        report("accounts", label + " per-account loop", per_account)
+        consolidated, _ = timed(lambda: engine.calculate_consolidated(summaries, positions, balances, live))
+        report("accounts", label + " consolidated", consolidated)
+
+
+# Dijalankan di proses Python baru agar tidak ada modul yang sudah ter-import (cold start sungguhan)
+STARTUP_SCRIPT = """
+import json, sys
+sys.path.insert(0, {app_dir!r})
+import market_data
+from fake_clients import FakeCoinGecko
+market_data.MarketDataClient = lambda *args, **kwargs: FakeCoinGecko(latency={latency!r})
+
+from streamlit.testing.v1 import AppTest
+from instrumentation import metrics
+runs = []
+at = AppTest.from_file({app_path!r}, default_timeout=120)
+at.secrets['COINGECKO_API_KEY'] = ''
+for _ in range(2):
+    metrics.reset()
+    at.run()
+    spans = metrics.snapshot()['spans']
+    runs.append({{name: spans[name]['last_seconds'] for name in ('render.skeleton', 'render.page') if name in spans}})
+print(json.dumps({{'runs': runs, 'exceptions': [str(e.value) for e in at.exception]}}))
+"""
+
+
+def bench_startup(sizes, latency):
+    """Time-to-first-paint dan waktu halaman penuh pada proses baru, dibandingkan dengan STARTUP_BUDGET."""
+    db_path = os.path.join(_BENCH_DIR, "startup_db.sqlite3")
+    trades = [dict(t, date=t['date'].isoformat()) for t in make_trades(1_000, 20)]
+    LocalSupabase(db_path).table('spot_trades').insert([{k: v for k, v in t.items() if k != 'id'} for t in trades]).execute()
+    script = STARTUP_SCRIPT.format(app_dir=APP_DIR, app_path=os.path.join(APP_DIR, "tracker_app.py"), latency=latency)
+    env = dict(os.environ, LOCAL_DB_PATH=db_path)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, cwd=APP_DIR)
+    process_seconds = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise SystemExit(f"startup: aplikasi gagal dijalankan\n{proc.stderr}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if result['exceptions']:
+        raise SystemExit(f"startup: exception di aplikasi: {result['exceptions']}")
+    cold, warm = result['runs']
+    report("startup", "cold first paint", cold['render.skeleton'], f"budget={STARTUP_BUDGET * 1000:.0f} ms")
+    report("startup", "cold full page", cold['render.page'])
+    report("startup", "warm first paint", warm['render.skeleton'])
+    report("startup", "warm full page", warm['render.page'])
+    report("startup", "subprocess total (2 runs)", process_seconds)
+    if cold['render.skeleton'] > STARTUP_BUDGET:
+        raise SystemExit(
+            f"startup: first paint {cold['render.skeleton'] * 1000:.0f} ms melebihi budget {STARTUP_BUDGET * 1000:.0f} ms"
+        )
+
+
+BENCHMARKS = {
+    'spot': bench_spot_summary,
+    'futures': bench_futures,
+    'history': bench_portfolio_history,
+    'sync': bench_table_sync,
+    'import': bench_trade_import,
+    'accounts': bench_accounts,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help="jalankan kurva ukuran penuh")
+    parser.add_argument('--only', choices=sorted(BENCHMARKS), action='append', help="kelompok yang dijalankan")
+    parser.add_argument('--latency', type=float, default=0.0, help="latensi buatan per panggilan API/DB (detik)")
+    args = parser.parse_args()
+
+    sizes = FULL_SIZES if args.full else QUICK_SIZES
+    try:
+        for name in args.only or BENCHMARKS:
+            BENCHMARKS[name](sizes, args.latency)
+    finally:
+        shutil.rmtree(_BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Pengganti CoinGecko untuk benchmark dan pengembangan offline.
+
+Hanya method yang benar-benar dipanggil aplikasi yang diimplementasikan.
+Pengganti Supabase ada di local_supabase.LocalSupabase (mis. path ':memory:').
+Data harga bersifat sintetis tetapi deterministik: harga koin pada suatu
+timestamp selalu sama di setiap panggilan, jadi hasil cache/store konsisten.
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DAY_MS = 86_400_000
+
+
+def _coin_params(coin_id):
+    seed = zlib.crc32(coin_id.encode())
+    base = 0.5 + (seed % 50_000)
+    phase = (seed >> 8) % 1000 / 1000 * 2 * np.pi
+    return base, phase
+
+
+def synthetic_prices(coin_id, timestamps_ms):
+    """Harga sintetis (tren + siklus mingguan + siklus harian) pada timestamp tertentu."""
+    base, phase = _coin_params(coin_id)
+    days = np.asarray(timestamps_ms, dtype=float) / DAY_MS
+    return base * (1 + 0.0005 * (days - 19_000)) * (
+        1 + 0.08 * np.sin(days / 7 + phase) + 0.01 * np.sin(days * 2 * np.pi + phase)
+    )
+
+
+class FakeCoinGecko:
+    """Meniru method pycoingecko yang dipakai aplikasi, dengan latensi buatan."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _hit(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _timestamps(from_ms, to_ms):
+        # Granularitas otomatis seperti CoinGecko: 5 menit (<=1 hari), per jam (<=90 hari), harian.
+        span = to_ms - from_ms
+        step = 300_000 if span <= DAY_MS else 3_600_000 if span <= 90 * DAY_MS else DAY_MS
+        return np.arange(from_ms - from_ms % step + step, to_ms + 1, step, dtype=np.int64)
+
+    def _chart(self, coin_id, timestamps):
+        prices = synthetic_prices(coin_id, timestamps)
+        caps = prices * 19_000_000
+        return {
+            'prices': [[int(t), float(p)] for t, p in zip(timestamps, prices)],
+            'market_caps': [[int(t), float(c)] for t, c in zip(timestamps, caps)],
+            'total_volumes': [[int(t), float(c) * 0.03] for t, c in zip(timestamps, caps)],
+        }
+
+    def ping(self):
+        self._hit()
+        return {'gecko_says': '(V3) To the Moon!'}
+
+    def get_coin_market_chart_by_id(self, id, vs_currency, days, **kwargs):
+        self._hit()
+        now_ms = int(time.time() * 1000)
+        return self._chart(id, self._timestamps(now_ms - int(float(days) * DAY_MS), now_ms))
+
+    def get_coin_market_chart_range_by_id(self, id, vs_currency, from_timestamp, to_timestamp, **kwargs):
+        self._hit()
+        return self._chart(id, self._timestamps(int(from_timestamp) * 1000, int(to_timestamp) * 1000))
+
+    def get_price(self, ids, vs_currencies, **kwargs):
+        self._hit()
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        now_ms = int(time.time() * 1000)
+        return {coin: {'usd': float(synthetic_prices(coin, [now_ms])[0])} for coin in ids}
+
+    def get_global_market_chart_range(self, from_timestamp, to_timestamp, vs_currency='usd', **kwargs):
+        self._hit()
+        timestamps = self._timestamps(int(from_timestamp) * 1000, int(to_timestamp) * 1000)
+        caps = synthetic_prices('bitcoin', timestamps) * 19_000_000 * 1.9
+        return {'market_caps': [[int(t), float(c)] for t, c in zip(timestamps, caps)]}
@@ -0,0 +1,185 @@
+"""Instrumentasi ringan untuk jalur panas: span waktu dan counter.
+
+Semua angka disimpan di memori proses (dipakai bersama semua sesi Streamlit)
+dan bisa diekspor sebagai JSON atau teks Prometheus. Satu span hanya butuh dua
+panggilan perf_counter dan satu lock, jadi aman dibiarkan aktif di produksi.
+Set INSTRUMENTATION=0 untuk mematikannya sama sekali.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION", "1") != "0"
+METRIC_PREFIX = "crypto_tracker"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Stages:
+    """Mengukur fase-fase berurutan dalam satu fungsi: setiap `mark()` mencatat waktu sejak mark sebelumnya."""
+
+    def __init__(self, metrics, prefix):
+        self.metrics = metrics
+        self.prefix = prefix
+        self.started = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.metrics.record(f"{self.prefix}.{stage}", now - self.last)
+        self.last = now
+
+    def done(self):
+        self.metrics.record(f"{self.prefix}.total", time.perf_counter() - self.started)
+
+
+class Metrics:
+    """Registry span (count, total, max, terakhir) dan counter, aman dipakai banyak thread."""
+
+    def __init__(self, enabled=INSTRUMENTATION_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._cache_calls = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._spans = {}
+            self._counters = {}
+            self._caches = {}
+            self.started_at = time.time()
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                self._spans[name] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+                stats[3] = seconds
+
+    def incr(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, name):
+        """Mengukur durasi blok `with`. Exception biasa juga dihitung di counter `<name>.errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.incr(f"{name}.errors")
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator: setiap panggilan fungsi menjadi satu span."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def stages(self, prefix):
+        return Stages(self, prefix)
+
+    def cached(self, name, cache_decorator):
+        """Membungkus decorator cache (mis. `st.cache_data(ttl=600)`) sambil menghitung hit dan miss.
+
+        Badan fungsi hanya dijalankan saat miss, jadi penandanya dipasang di
+        dalam fungsi yang di-cache; pembungkus luar menghitung semua panggilan.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def on_miss(*args, **kwargs):
+                calls = getattr(self._cache_calls, "stack", None)
+                if calls:
+                    calls[-1] = True
+                return fn(*args, **kwargs)
+            cached_fn = cache_decorator(on_miss)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                stack = self._cache_calls.__dict__.setdefault("stack", [])
+                stack.append(False)
+                try:
+                    with self.span(f"cache.{name}"):
+                        return cached_fn(*args, **kwargs)
+                finally:
+                    self._count_cache(name, stack.pop())
+            wrapper.clear = cached_fn.clear
+            return wrapper
+        return decorate
+
+    def _count_cache(self, name, missed):
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self._caches.setdefault(name, [0, 0])
+            counts[1 if missed else 0] += 1
+
+    def snapshot(self):
+        """Salinan semua angka sebagai dict biasa (dasar untuk panel dan export)."""
+        with self._lock:
+            spans = {
+                name: {
+                    'count': count, 'total_seconds': total, 'mean_seconds': total / count,
+                    'max_seconds': longest, 'last_seconds': last,
+                }
+                for name, (count, total, longest, last) in self._spans.items()
+            }
+            caches = {
+                name: {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+                for name, (hits, misses) in self._caches.items()
+            }
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'spans': spans,
+                'caches': caches,
+                'counters': dict(self._counters),
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent, sort_keys=True)
+
+    def to_prometheus(self):
+        """Format teks exposition Prometheus."""
+        data = self.snapshot()
+        p = METRIC_PREFIX
+        lines = [
+            f"# TYPE {p}_uptime_seconds gauge",
+            f"{p}_uptime_seconds {data['uptime_seconds']:.3f}",
+            f"# TYPE {p}_span_seconds summary",
+        ]
+        for name, stats in sorted(data['spans'].items()):
+            lines.append(f'{p}_span_seconds_count{{span="{_label(name)}"}} {stats["count"]}')
+            lines.append(f'{p}_span_seconds_sum{{span="{_label(name)}"}} {stats["total_seconds"]:.6f}')
+        lines.append(f"# TYPE {p}_span_max_seconds gauge")
+        for name, stats in sorted(data['spans'].items()):
+            lines.append(f'{p}_span_max_seconds{{span="{_label(name)}"}} {stats["max_seconds"]:.6f}')
+        lines.append(f"# TYPE {p}_cache_requests_total counter")
+        for name, stats in sorted(data['caches'].items()):
+            lines.append(f'{p}_cache_requests_total{{cache="{_label(name)}",result="hit"}} {stats["hits"]}')
+            lines.append(f'{p}_cache_requests_total{{cache="{_label(name)}",result="miss"}} {stats["misses"]}')
+        lines.append(f"# TYPE {p}_events_total counter")
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f'{p}_events_total{{event="{_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+# Registry bersama untuk seluruh proses
+metrics = Metrics()
@@ -0,0 +1,262 @@
+"""Pengganti Supabase berbasis SQLite untuk worker snapshot, pengembangan offline dan benchmark.
+
+Meniru subset API supabase-py yang dipakai aplikasi:
+table().select/insert/upsert/update/delete + eq/gt/order/limit/range, lalu
+.execute().data, serta rpc('adjust_futures_wallet', ...). Skema tabelnya sama
+dengan tabel Supabase aplikasi, termasuk kolom `account_id`. Dengan path
+':memory:' database hanya hidup selama objeknya ada (dipakai benchmark).
+"""
+import os
+import threading
+import time
+
+from price_store import connect
+
+DEFAULT_LOCAL_DB_PATH = os.environ.get(
+    "LOCAL_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_db.sqlite3"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+INSERT OR IGNORE INTO accounts (id, name) VALUES (1, 'Main');
+
+CREATE TABLE IF NOT EXISTS spot_trades (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id     INTEGER NOT NULL DEFAULT 1,
+    date           TEXT NOT NULL,
+    coin           TEXT NOT NULL,
+    type           TEXT NOT NULL,
+    amount         REAL NOT NULL,
+    price_per_coin REAL NOT NULL,
+    total_cost_usd REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS futures_positions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id  INTEGER NOT NULL DEFAULT 1,
+    coin_id     TEXT NOT NULL,
+    direction   TEXT NOT NULL,
+    entry_price REAL NOT NULL,
+    margin      REAL NOT NULL,
+    leverage    INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS futures_wallet (
+    id         INTEGER PRIMARY KEY,
+    account_id INTEGER NOT NULL DEFAULT 1,
+    balance    REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Sama dengan index di supabase/migrations; dibuat setelah kolom account_id dipastikan ada
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS spot_trades_account_id_idx ON spot_trades (account_id, id);
+CREATE INDEX IF NOT EXISTS futures_positions_account_id_idx ON futures_positions (account_id, id);
+CREATE UNIQUE INDEX IF NOT EXISTS futures_wallet_account_id_key ON futures_wallet (account_id);
+"""
+
+
+class LocalResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class LocalQuery:
+    """Query builder berantai yang diterjemahkan ke satu statement SQL saat execute()."""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = "*"
+        self.payload = None
+        self.where = []
+        self.params = []
+        self.order_by = None
+        self.limit_count = None
+        self.offset = 0
+        self.returning = 'representation'
+
+    def select(self, columns="*", **kwargs):
+        self.action = 'select'
+        self.columns = ", ".join(c.strip() for c in columns.split(','))
+        return self
+
+    def insert(self, rows, returning='representation', **kwargs):
+        self.action, self.payload, self.returning = 'insert', rows, returning
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self.action, self.payload = 'upsert', rows
+        return self
+
+    def update(self, values, **kwargs):
+        self.action, self.payload = 'update', values
+        return self
+
+    def delete(self, **kwargs):
+        self.action = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.where.append(f"{column} = ?")
+        self.params.append(value)
+        return self
+
+    def gt(self, column, value):
+        self.where.append(f"{column} > ?")
+        self.params.append(value)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.order_by = f"{column} {'DESC' if desc else 'ASC'}"
+        return self
+
+    def limit(self, count, **kwargs):
+        self.limit_count = count
+        return self
+
+    def range(self, start, end, **kwargs):
+        self.offset, self.limit_count = start, end - start + 1
+        return self
+
+    def _where_sql(self):
+        return f" WHERE {' AND '.join(self.where)}" if self.where else ""
+
+    def execute(self):
+        self.db._hit()
+        with self.db._lock, self.db._conn as conn:
+            return LocalResponse(getattr(self, f"_execute_{self.action}")(conn))
+
+    def _execute_select(self, conn):
+        sql = f"SELECT {self.columns} FROM {self.table}{self._where_sql()}"
+        if self.order_by:
+            sql += f" ORDER BY {self.order_by}"
+        # Seperti PostgREST: jumlah baris per respons dibatasi max_rows
+        count = self.db.max_rows if self.limit_count is None else min(self.limit_count, self.db.max_rows)
+        sql += f" LIMIT {int(count)} OFFSET {int(self.offset)}"
+        return conn.execute(sql, self.params).fetchall()
+
+    def _write_rows(self, conn, on_conflict=""):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        result = []
+        for row in rows:
+            columns = list(row)
+            sql = (
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                f"{on_conflict and on_conflict.format(updates=', '.join(f'{c} = excluded.{c}' for c in columns))}"
+                " RETURNING *"
+            )
+            result.extend(conn.execute(sql, [row[c] for c in columns]).fetchall())
+        return result
+
+    def _execute_insert(self, conn):
+        if self.returning != 'minimal':
+            return self._write_rows(conn)
+        # returning='minimal': tanpa baris balik, jadi satu executemany per susunan kolom
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(tuple(row), []).append(tuple(row.values()))
+        for columns, values in by_columns.items():
+            conn.executemany(
+                f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+            )
+        return []
+
+    def _execute_upsert(self, conn):
+        return self._write_rows(conn, " ON CONFLICT (id) DO UPDATE SET {updates}")
+
+    def _execute_update(self, conn):
+        columns = list(self.payload)
+        sql = f"UPDATE {self.table} SET {', '.join(f'{c} = ?' for c in columns)}{self._where_sql()} RETURNING *"
+        return conn.execute(sql, [self.payload[c] for c in columns] + self.params).fetchall()
+
+    def _execute_delete(self, conn):
+        return conn.execute(f"DELETE FROM {self.table}{self._where_sql()} RETURNING *", self.params).fetchall()
+
+
+class LocalRPC:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params or {}
+
+    def execute(self):
+        self.db._hit()
+        with self.db._lock, self.db._conn as conn:
+            return LocalResponse(self.db.functions[self.fn](conn, **self.params))
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _adjust_futures_wallet(conn, p_account_id, p_delta):
+    """Padanan SQLite dari fungsi SQL `adjust_futures_wallet` di supabase/migrations."""
+    new_balance = conn.execute(
+        "INSERT INTO futures_wallet (id, account_id, balance) VALUES (?, ?, ?) "
+        "ON CONFLICT (account_id) DO UPDATE SET balance = balance + excluded.balance RETURNING balance",
+        (p_account_id, p_account_id, p_delta),
+    ).fetchone()['balance']
+    if new_balance < 0:
+        conn.rollback()
+        raise ValueError(f"Saldo futures wallet tidak cukup ({new_balance - p_delta}).")
+    return new_balance
+
+
+class LocalSupabase:
+    """Klien 'Supabase' di atas satu file SQLite; aman dipakai beberapa thread dan proses.
+
+    `latency` menambahkan jeda buatan per round trip (execute) dan `calls`
+    menghitung jumlah round trip, untuk benchmark.
+    """
+
+    def __init__(self, path=DEFAULT_LOCAL_DB_PATH, max_rows=1000, latency=0.0):
+        self.path = path
+        self.max_rows = max_rows
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.functions = {'adjust_futures_wallet': _adjust_futures_wallet}
+        # Satu koneksi per klien (wajib untuk ':memory:'); akses diserialkan oleh _lock
+        self._conn = connect(self.path, check_same_thread=False)
+        self._conn.row_factory = _dict_row
+        with self._lock, self._conn as conn:
+            conn.executescript(_SCHEMA)
+            # File dari versi tanpa akun: semua baris lama menjadi milik akun bawaan
+            for table in ('spot_trades', 'futures_positions', 'futures_wallet'):
+                columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if 'account_id' not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN account_id INTEGER NOT NULL DEFAULT 1")
+            conn.executescript(_INDEXES)
+
+    def _hit(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def rpc(self, fn, params=None, **kwargs):
+        return LocalRPC(self, fn, params)
+
+    def seed(self, name, rows):
+        """Mengisi tabel langsung tanpa latensi dan tanpa dihitung sebagai round trip."""
+        with self._lock, self._conn as conn:
+            for row in rows:
+                columns = list(row)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [row[c] for c in columns],
+                )
+
+    def rows(self, name):
+        """Semua baris tabel (urut id) tanpa batas max_rows, untuk pemeriksaan dan benchmark."""
+        with self._lock:
+            return self._conn.execute(f"SELECT * FROM {name} ORDER BY id").fetchall()
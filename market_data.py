@@ -0,0 +1,267 @@
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import metrics
+
+# Kuota publik CoinGecko sekitar 30 panggilan per menit; bisa dinaikkan untuk API key berbayar.
+COINGECKO_CALLS_PER_MINUTE = int(os.environ.get("COINGECKO_CALLS_PER_MINUTE", "30"))
+MAX_FETCH_WORKERS = int(os.environ.get("MAX_FETCH_WORKERS", "8"))
+LIVE_PRICE_TTL = float(os.environ.get("LIVE_PRICE_TTL", "30"))
+# Harga yang lebih tua dari ini tidak lagi dipakai sebagai harga basi: harus diambil ulang
+LIVE_PRICE_MAX_STALE = float(os.environ.get("LIVE_PRICE_MAX_STALE", str(LIVE_PRICE_TTL * 10)))
+COINGECKO_TIMEOUT = float(os.environ.get("COINGECKO_TIMEOUT", "15"))
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3/"
+COINGECKO_PRO_API_URL = "https://pro-api.coingecko.com/api/v3/"
+
+
+class RateLimitError(Exception):
+    """Upstream menolak permintaan karena kuota habis (HTTP 429)."""
+
+
+class TokenBucket:
+    """Rate limiter token-bucket yang dipakai bersama oleh semua thread."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, rate_per_minute // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited:
+                        # Tekanan kuota: berapa lama panggilan tertahan oleh limiter
+                        metrics.record("coingecko.limiter_wait", waited)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+coingecko_limiter = TokenBucket(COINGECKO_CALLS_PER_MINUTE)
+
+
+def is_rate_limited(exc):
+    """Mengenali error 429, baik dari requests maupun ValueError berisi JSON dari pycoingecko."""
+    if isinstance(exc, RateLimitError):
+        return True
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    payload = exc.args[0] if exc.args else None
+    if isinstance(payload, dict):
+        status = payload.get("status") or {}
+        return status.get("error_code") == 429
+    return False
+
+
+def call_with_backoff(fn, *args, limiter=None, max_retries=5, base_delay=2.0, **kwargs):
+    """Memanggil fn lewat rate limiter, mengulang dengan exponential backoff saat kena 429."""
+    limiter = limiter or coingecko_limiter
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == max_retries:
+                raise
+            metrics.incr("coingecko.rate_limited")
+            time.sleep(base_delay * (2 ** attempt) + random.uniform(0, base_delay))
+
+
+def fetch_concurrently(fn, items, max_workers=MAX_FETCH_WORKERS):
+    """Menjalankan fn(item) secara paralel.
+
+    Mengembalikan (results, errors): dua dict per item. Kegagalan satu item
+    tidak membatalkan item lain.
+    """
+    results, errors = {}, {}
+    if not items:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                errors[item] = e
+    return results, errors
+
+
+def fetch_live_prices(cg_client, coins):
+    """Satu panggilan simple/price untuk banyak koin; hasilnya dict coin -> harga USD."""
+    price_data = call_with_backoff(cg_client.get_price, ids=list(coins), vs_currencies='usd')
+    return {coin: data.get('usd', 0) for coin, data in price_data.items()}
+
+
+class LivePriceCache:
+    """Cache harga live per koin yang dipakai bersama oleh semua sesi dalam satu proses.
+
+    - Harga yang umurnya < ttl dipakai langsung tanpa memanggil API.
+    - Koin yang sedang diambil oleh sesi lain tidak diminta ulang (single-flight);
+      semua koin yang perlu diambil digabung menjadi satu panggilan batch.
+    - Harga basi tetap dikembalikan sementara refresh berjalan di background,
+      selama umurnya < max_stale. Koin tanpa harga atau dengan harga yang lebih
+      tua dari itu harus ditunggu, dan kegagalannya dilempar ke pemanggil.
+    - `last_error` menyimpan kegagalan refresh terakhir; lihat juga `age()`.
+    """
+
+    def __init__(self, fetch_fn, ttl=LIVE_PRICE_TTL, max_stale=LIVE_PRICE_MAX_STALE):
+        self.fetch_fn = fetch_fn
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._prices = {}
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="live-prices")
+
+    def _refresh(self, coins, future):
+        try:
+            prices = self.fetch_fn(coins)
+            fetched_at = time.monotonic()
+            with self._lock:
+                for coin in coins:
+                    self._prices[coin] = (prices.get(coin, 0), fetched_at)
+            self.last_error = None
+            future.set_result(prices)
+        except Exception as e:
+            self.last_error = e
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                for coin in coins:
+                    if self._inflight.get(coin) is future:
+                        del self._inflight[coin]
+
+    def age(self, coins):
+        """Umur (detik) harga tertua di antara `coins` yang sudah punya harga, atau None."""
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - self._prices[coin][1] for coin in coins if coin in self._prices]
+        return max(ages) if ages else None
+
+    def get_prices(self, coins):
+        """Harga untuk `coins`. Melempar error jika koin tanpa harga yang masih bisa dipakai gagal diambil."""
+        now = time.monotonic()
+        missing, stale, waits = [], [], set()
+        fresh = 0
+        with self._lock:
+            for coin in set(coins):
+                cached = self._prices.get(coin)
+                if cached is not None and now - cached[1] < self.ttl:
+                    fresh += 1
+                    continue
+                # Harga yang terlalu tua diperlakukan seperti belum ada: refresh sinkron
+                usable = cached is not None and now - cached[1] < self.max_stale
+                inflight = self._inflight.get(coin)
+                if inflight is not None:
+                    if not usable:
+                        waits.add(inflight)
+                    continue
+                (stale if usable else missing).append(coin)
+            metrics.incr("live_prices.fresh", fresh)
+            metrics.incr("live_prices.stale", len(stale))
+            metrics.incr("live_prices.missing", len(missing))
+            to_fetch = missing + stale
+            if to_fetch:
+                future = Future()
+                for coin in to_fetch:
+                    self._inflight[coin] = future
+
+        if missing:
+            self._refresh(to_fetch, future)
+            waits.add(future)
+        elif stale:
+            self._executor.submit(self._refresh, to_fetch, future)
+
+        for pending in waits:
+            pending.result()
+        with self._lock:
+            return {coin: self._prices[coin][0] for coin in coins if coin in self._prices}
+
+
+class MarketDataClient:
+    """Klien HTTP CoinGecko dengan pool koneksi keep-alive yang aman dipakai banyak thread.
+
+    Nama dan argumen method sama dengan pycoingecko yang dipakai aplikasi.
+    Error jaringan, timeout dan 5xx diulang dengan jitter; 429 dilempar sebagai
+    RateLimitError supaya ditangani oleh `call_with_backoff`. Tidak ada ping saat start.
+    """
+
+    def __init__(self, api_key="", demo_api_key="", timeout=COINGECKO_TIMEOUT, pool_size=MAX_FETCH_WORKERS * 2,
+                 max_retries=3, base_delay=0.5):
+        self.base_url = COINGECKO_PRO_API_URL if api_key else COINGECKO_API_URL
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/json"
+        if api_key:
+            self.session.headers["x-cg-pro-api-key"] = api_key
+        elif demo_api_key:
+            self.session.headers["x-cg-demo-api-key"] = demo_api_key
+
+    def _get(self, path, params):
+        # Id koin tidak ikut nama span agar jumlah metrik tetap kecil
+        span_name = "coingecko." + re.sub(r"coins/[^/]+", "coins/{id}", path)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.incr("coingecko.http_retries")
+            try:
+                with metrics.span(span_name):
+                    response = self.session.get(self.base_url + path, params=params, timeout=(3.05, self.timeout))
+                if response.status_code == 429:
+                    raise RateLimitError(f"CoinGecko rate limit: {path}")
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"{response.status_code} dari CoinGecko: {path}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(random.uniform(0, self.base_delay * (2 ** attempt)))
+
+    def get_price(self, ids, vs_currencies, **kwargs):
+        if not isinstance(ids, str):
+            ids = ",".join(ids)
+        return self._get("simple/price", dict(kwargs, ids=ids, vs_currencies=vs_currencies))
+
+    def get_coin_market_chart_by_id(self, id, vs_currency, days, **kwargs):
+        return self._get(f"coins/{id}/market_chart", dict(kwargs, vs_currency=vs_currency, days=days))
+
+    def get_coin_market_chart_range_by_id(self, id, vs_currency, from_timestamp, to_timestamp, **kwargs):
+        params = dict(kwargs, vs_currency=vs_currency, to=to_timestamp)
+        params["from"] = from_timestamp
+        return self._get(f"coins/{id}/market_chart/range", params)
+
+    def get_global_market_chart_range(self, from_timestamp, to_timestamp, vs_currency="usd", **kwargs):
+        """Market cap global dalam rentang waktu, format {'market_caps': [[ms, cap], ...]}.
+
+        CoinGecko hanya menyediakan `global/market_cap_chart?days=N` (butuh API key),
+        jadi rentangnya dikonversi ke jumlah hari lalu dipotong sesuai rentang.
+        """
+        days = max(1, int((to_timestamp - from_timestamp) // 86400) + 1)
+        data = self._get("global/market_cap_chart", dict(kwargs, vs_currency=vs_currency, days=days))
+        caps = data["market_cap_chart"]["market_cap"]
+        from_ms, to_ms = from_timestamp * 1000, to_timestamp * 1000
+        return {"market_caps": [point for point in caps if from_ms <= point[0] <= to_ms]}
@@ -0,0 +1,293 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from market_data import call_with_backoff
+
+# Lokasi file SQLite bisa diatur lewat env var; default di folder aplikasi.
+DEFAULT_STORE_PATH = os.environ.get(
+    "PRICE_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_store.sqlite3"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_prices (
+    coin_id TEXT NOT NULL,
+    date    TEXT NOT NULL,
+    price   REAL NOT NULL,
+    PRIMARY KEY (coin_id, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS price_coverage (
+    coin_id    TEXT PRIMARY KEY,
+    start_date TEXT NOT NULL,
+    end_date   TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS open_day_fetches (
+    coin_id    TEXT PRIMARY KEY,
+    date       TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS intraday_prices (
+    coin_id TEXT    NOT NULL,
+    ts      INTEGER NOT NULL,
+    price   REAL    NOT NULL,
+    PRIMARY KEY (coin_id, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS intraday_coverage (
+    coin_id    TEXT    NOT NULL,
+    resolution TEXT    NOT NULL,
+    start_ts   INTEGER NOT NULL,
+    end_ts     INTEGER NOT NULL,
+    PRIMARY KEY (coin_id, resolution)
+);
+"""
+
+# Rentang maksimum per panggilan agar CoinGecko mengembalikan granularitas yang diminta:
+# per jam untuk rentang <= 90 hari, 5 menit untuk rentang <= 1 hari.
+INTRADAY_CHUNK_SECONDS = {'1h': 90 * 86400, '5min': 86400}
+
+# Harga hari ini (belum lengkap) dianggap masih segar selama sekian detik setelah diambil
+OPEN_DAY_TTL = float(os.environ.get("OPEN_DAY_TTL", "600"))
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+def connect(path=DEFAULT_STORE_PATH, **kwargs):
+    """Membuka koneksi SQLite yang aman dipakai bersama oleh beberapa proses."""
+    conn = sqlite3.connect(path, timeout=30, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def daily_average(points):
+    """Mengubah list [timestamp_ms, price] dari CoinGecko menjadi rata-rata harian (UTC)."""
+    df = pd.DataFrame(points, columns=['Timestamp', 'Price'])
+    df['Date'] = pd.to_datetime(df['Timestamp'], unit='ms').dt.date
+    return df.groupby('Date')[['Price']].mean()
+
+
+class PriceStore:
+    """Penyimpanan harga harian per koin di disk, beserta rentang hari yang sudah lengkap.
+
+    Setiap koin punya satu rentang tercakup [start_date, end_date] yang selalu
+    bersambung, jadi yang perlu diambil dari API hanya celah sebelum dan sesudahnya.
+    Hari ini (UTC) tidak pernah dianggap lengkap karena rata-ratanya masih berubah;
+    waktu pengambilannya dicatat sehingga baru diambil ulang setelah `open_day_ttl`.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, open_day_ttl=OPEN_DAY_TTL):
+        self.path = path
+        self.open_day_ttl = open_day_ttl
+        self._lock = threading.Lock()
+        with connect(self.path) as conn:
+            conn.executescript(_SCHEMA)
+
+    def coverage(self, coin_id):
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT start_date, end_date FROM price_coverage WHERE coin_id = ?", (coin_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return date.fromisoformat(row[0]), date.fromisoformat(row[1])
+
+    def missing_ranges(self, coin_id, start, end):
+        """Daftar (start, end) hari yang belum tersimpan untuk rentang yang diminta."""
+        covered = self.coverage(coin_id)
+        if covered is None:
+            return [(start, end)]
+        cov_start, cov_end = covered
+        gaps = []
+        if start < cov_start:
+            gaps.append((start, cov_start - timedelta(days=1)))
+        if end > cov_end:
+            gap_start = max(start, cov_end + timedelta(days=1))
+            # Celah yang hanya berisi hari ini dilewati selama hasil ambilan terakhir masih segar
+            if not (gap_start >= utc_today() and self.open_day_fresh(coin_id)):
+                gaps.append((gap_start, end))
+        return gaps
+
+    def open_day_fresh(self, coin_id):
+        """True jika harga hari ini untuk koin diambil kurang dari `open_day_ttl` detik lalu."""
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT date, fetched_at FROM open_day_fetches WHERE coin_id = ?", (coin_id,)
+            ).fetchone()
+        return (
+            row is not None
+            and row[0] == utc_today().isoformat()
+            and time.time() - row[1] < self.open_day_ttl
+        )
+
+    def write(self, coin_id, daily_df, start, end):
+        """Menyimpan harga harian dan memperluas rentang tercakup (tanpa hari ini)."""
+        rows = [(coin_id, d.isoformat(), float(p)) for d, p in daily_df['Price'].items()]
+        today = utc_today()
+        complete_end = min(end, today - timedelta(days=1))
+        with self._lock, connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_prices (coin_id, date, price) VALUES (?, ?, ?)", rows
+            )
+            if end >= today:
+                conn.execute(
+                    "INSERT OR REPLACE INTO open_day_fetches (coin_id, date, fetched_at) VALUES (?, ?, ?)",
+                    (coin_id, today.isoformat(), time.time()),
+                )
+            if complete_end < start:
+                return
+            covered = conn.execute(
+                "SELECT start_date, end_date FROM price_coverage WHERE coin_id = ?", (coin_id,)
+            ).fetchone()
+            new_start, new_end = start, complete_end
+            if covered is not None:
+                new_start = min(new_start, date.fromisoformat(covered[0]))
+                new_end = max(new_end, date.fromisoformat(covered[1]))
+            conn.execute(
+                "INSERT OR REPLACE INTO price_coverage (coin_id, start_date, end_date) VALUES (?, ?, ?)",
+                (coin_id, new_start.isoformat(), new_end.isoformat()),
+            )
+
+    def read(self, coin_id, start, end):
+        """Harga harian tersimpan sebagai DataFrame ber-index 'Date' dengan kolom 'Price'."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT date, price FROM daily_prices WHERE coin_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (coin_id, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows, columns=['Date', 'Price'])
+        df['Date'] = pd.to_datetime(df['Date']).dt.date
+        return df.set_index('Date')
+
+    def intraday_coverage(self, coin_id, resolution):
+        """(start_ts, end_ts) intraday yang sudah lengkap, atau None."""
+        with connect(self.path) as conn:
+            return conn.execute(
+                "SELECT start_ts, end_ts FROM intraday_coverage WHERE coin_id = ? AND resolution = ?",
+                (coin_id, resolution),
+            ).fetchone()
+
+    def missing_intraday_ranges(self, coin_id, resolution, start_ts, end_ts):
+        """Seperti missing_ranges, tetapi dalam detik UNIX untuk data intraday."""
+        row = self.intraday_coverage(coin_id, resolution)
+        if row is None:
+            return [(start_ts, end_ts)]
+        gaps = []
+        if start_ts < row[0]:
+            gaps.append((start_ts, row[0]))
+        if end_ts > row[1]:
+            gaps.append((max(start_ts, row[1]), end_ts))
+        return gaps
+
+    def write_intraday(self, coin_id, resolution, points, start_ts, end_ts):
+        """Menyimpan titik [ms, price] mentah; cakupan berakhir di titik terakhir yang diterima.
+
+        Cakupan hanya diperluas jika rentang yang ditulis bersambung dengan cakupan
+        yang sudah ada, jadi celah di antaranya tidak pernah dianggap sudah diambil.
+        Rentang yang seluruhnya lebih baru menggantikan cakupan lama.
+        """
+        rows = [(coin_id, int(ts), float(price)) for ts, price in points]
+        # Rentang lampau dianggap lengkap (juga tanpa data, mis. koin belum listing);
+        # rentang yang mencapai sekarang hanya sampai titik terakhir yang diterima
+        past = end_ts < datetime.now(timezone.utc).timestamp() - 3600
+        if past:
+            covered_end = end_ts
+        elif rows:
+            covered_end = min(end_ts, max(ts for _, ts, _ in rows) // 1000)
+        else:
+            covered_end = start_ts
+        with self._lock, connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO intraday_prices (coin_id, ts, price) VALUES (?, ?, ?)", rows
+            )
+            row = conn.execute(
+                "SELECT start_ts, end_ts FROM intraday_coverage WHERE coin_id = ? AND resolution = ?",
+                (coin_id, resolution),
+            ).fetchone()
+            new_start, new_end = start_ts, covered_end
+            if row is not None and end_ts < row[0]:
+                return
+            if row is not None and start_ts <= row[1]:
+                new_start, new_end = min(new_start, row[0]), max(new_end, row[1])
+            conn.execute(
+                "INSERT OR REPLACE INTO intraday_coverage (coin_id, resolution, start_ts, end_ts) VALUES (?, ?, ?, ?)",
+                (coin_id, resolution, new_start, new_end),
+            )
+
+    def read_intraday(self, coin_id, start_ts, end_ts):
+        """(timestamps_ms int64, prices float32) terurut untuk rentang detik UNIX yang diminta."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT ts, price FROM intraday_prices WHERE coin_id = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (coin_id, start_ts * 1000, end_ts * 1000),
+            ).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return data[:, 0].astype(np.int64), data[:, 1].astype(np.float32)
+
+
+def _intraday_chunks(gap_start, gap_end, chunk, backward):
+    """Potongan (start, end) sebuah celah, dari yang terlama atau (backward) dari yang terbaru."""
+    starts = range(int(gap_start), int(gap_end), chunk)
+    chunks = [(s, min(s + chunk, int(gap_end))) for s in starts]
+    return chunks[::-1] if backward else chunks
+
+
+def sync_intraday_history(cg_client, store, coin_id, resolution, start_ts, end_ts):
+    """Mengambil titik intraday yang belum tersimpan, dipecah per potongan sesuai resolusi.
+
+    Tiap celah diambil dari sisi yang menempel ke cakupan (celah sebelum cakupan
+    mundur dari yang terbaru), sehingga potongan yang gagal hanya menghentikan
+    celah itu; data yang lebih dekat tetap tersimpan. Kegagalan pertama
+    dilempar ulang setelah semua celah dicoba.
+    """
+    chunk = INTRADAY_CHUNK_SECONDS[resolution]
+    coverage = store.intraday_coverage(coin_id, resolution)
+    first_error = None
+    for gap_start, gap_end in store.missing_intraday_ranges(coin_id, resolution, start_ts, end_ts):
+        # Celah yang dimulai tepat di akhir cakupan maju; selain itu mundur dari yang terbaru
+        backward = coverage is None or gap_start != coverage[1]
+        for chunk_start, chunk_end in _intraday_chunks(gap_start, gap_end, chunk, backward):
+            try:
+                chart_data = call_with_backoff(
+                    cg_client.get_coin_market_chart_range_by_id,
+                    id=coin_id,
+                    vs_currency='usd',
+                    from_timestamp=chunk_start,
+                    to_timestamp=chunk_end,
+                )
+            except Exception as e:
+                first_error = first_error or e
+                break
+            store.write_intraday(coin_id, resolution, chart_data['prices'], chunk_start, chunk_end)
+    if first_error is not None:
+        raise first_error
+
+
+def sync_price_history(cg_client, store, coin_id, start, end):
+    """Mengambil hanya hari yang belum ada di store dari CoinGecko, lalu menyimpannya."""
+    for gap_start, gap_end in store.missing_ranges(coin_id, start, end):
+        from_ts = datetime.combine(gap_start, datetime.min.time(), tzinfo=timezone.utc).timestamp()
+        to_ts = datetime.combine(gap_end + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).timestamp()
+        to_ts = min(to_ts, datetime.now(timezone.utc).timestamp())
+        chart_data = call_with_backoff(
+            cg_client.get_coin_market_chart_range_by_id,
+            id=coin_id,
+            vs_currency='usd',
+            from_timestamp=int(from_ts),
+            to_timestamp=int(to_ts),
+        )
+        daily_df = daily_average(chart_data['prices'])
+        store.write(coin_id, daily_df, gap_start, gap_end)
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import date
+from io import StringIO
+
+import pandas as pd
+
+from price_store import DEFAULT_STORE_PATH, connect
+from table_sync import DEFAULT_ACCOUNT_ID
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS holdings_snapshots (
+    account_id INTEGER NOT NULL,
+    date       TEXT NOT NULL,
+    coin_id    TEXT NOT NULL,
+    holdings   REAL NOT NULL,
+    price      REAL NOT NULL,
+    PRIMARY KEY (account_id, date, coin_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+    account_id  INTEGER NOT NULL,
+    date        TEXT NOT NULL,
+    total_value REAL NOT NULL,
+    trades_hash TEXT,
+    PRIMARY KEY (account_id, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS equity_snapshots (
+    account_id          INTEGER NOT NULL,
+    ts                  INTEGER NOT NULL,
+    data_key            TEXT NOT NULL,
+    total_spot_value    REAL NOT NULL,
+    total_spot_pl       REAL NOT NULL,
+    total_futures_equity REAL NOT NULL,
+    total_futures_pnl   REAL NOT NULL,
+    grand_total         REAL NOT NULL,
+    state               TEXT NOT NULL,
+    PRIMARY KEY (account_id, ts)
+);
+"""
+
+
+# Kolom angka dashboard yang disimpan per snapshot (selain DataFrame di kolom `state`)
+EQUITY_COLUMNS = ['total_spot_value', 'total_spot_pl', 'total_futures_equity', 'total_futures_pnl', 'grand_total']
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _create_schema(path):
+    """Membuat tabel; file dari versi tanpa account_id dimigrasikan ke akun bawaan.
+
+    Snapshot harian hanya hasil turunan, jadi cukup dibuang dan dihitung ulang;
+    riwayat equity tidak bisa dihitung ulang sehingga disalin ke tabel baru.
+    """
+    with connect(path) as conn:
+        for table in ('holdings_snapshots', 'portfolio_snapshots'):
+            if _columns(conn, table) and 'account_id' not in _columns(conn, table):
+                conn.execute(f"DROP TABLE {table}")
+        legacy_equity = _columns(conn, 'equity_snapshots') and 'account_id' not in _columns(conn, 'equity_snapshots')
+        if legacy_equity:
+            conn.execute("ALTER TABLE equity_snapshots RENAME TO equity_snapshots_legacy")
+        conn.executescript(_SCHEMA)
+        if legacy_equity:
+            columns = ', '.join(['ts', 'data_key', *EQUITY_COLUMNS, 'state'])
+            conn.execute(
+                f"INSERT INTO equity_snapshots (account_id, {columns}) "
+                f"SELECT ?, {columns} FROM equity_snapshots_legacy", (DEFAULT_ACCOUNT_ID,),
+            )
+            conn.execute("DROP TABLE equity_snapshots_legacy")
+
+
+class PortfolioSnapshotStore:
+    """Tabel harian holding & nilai portofolio yang sudah dihitung (materialized).
+
+    Setiap hari yang sudah final disimpan satu kali. `trades_hash` mencatat
+    sidik jari trade pada hari itu, sehingga trade yang ditambah/dihapus bisa
+    dideteksi dan hanya hari sejak tanggal trade tersebut yang dihitung ulang.
+    Satu instance hanya membaca/menulis baris milik `account_id`.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, account_id=DEFAULT_ACCOUNT_ID):
+        self.path = path
+        self.account_id = account_id
+        self._lock = threading.Lock()
+        _create_schema(self.path)
+
+    def first_changed_day(self, day_hashes):
+        """Tanggal paling awal di mana trade tersimpan berbeda dari `day_hashes` (Series date -> hash)."""
+        last = self.last_date()
+        if last is None:
+            return None
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT date, trades_hash FROM portfolio_snapshots WHERE account_id = ? AND trades_hash IS NOT NULL",
+                (self.account_id,),
+            ).fetchall()
+        stored = {date.fromisoformat(d): h for d, h in rows}
+        current = {d: h for d, h in day_hashes.items() if d <= last}
+        changed = [d for d in stored.keys() | current.keys() if stored.get(d) != current.get(d)]
+        return min(changed) if changed else None
+
+    def invalidate_from(self, from_date):
+        with self._lock, connect(self.path) as conn:
+            params = (self.account_id, from_date.isoformat())
+            conn.execute("DELETE FROM holdings_snapshots WHERE account_id = ? AND date >= ?", params)
+            conn.execute("DELETE FROM portfolio_snapshots WHERE account_id = ? AND date >= ?", params)
+
+    def last_date(self):
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT MAX(date) FROM portfolio_snapshots WHERE account_id = ?", (self.account_id,)
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row[0] else None
+
+    def holdings_on(self, day):
+        """Holding per koin pada satu hari sebagai Series coin_id -> amount."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT coin_id, holdings FROM holdings_snapshots WHERE account_id = ? AND date = ?",
+                (self.account_id, day.isoformat()),
+            ).fetchall()
+        return pd.Series(dict(rows), dtype=float)
+
+    def prices_on(self, day):
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT coin_id, price FROM holdings_snapshots WHERE account_id = ? AND date = ?",
+                (self.account_id, day.isoformat()),
+            ).fetchall()
+        return pd.Series(dict(rows), dtype=float)
+
+    def append(self, holdings_df, prices_df, total_value, day_hashes):
+        """Menyimpan hari-hari baru. Koin dengan holding nol tidak disimpan."""
+        long_df = pd.DataFrame({
+            'holdings': holdings_df.stack(),
+            'price': prices_df.reindex_like(holdings_df).stack(),
+        })
+        long_df = long_df[long_df['holdings'] != 0]
+        holding_rows = [
+            (self.account_id, d.isoformat(), coin, float(h), float(p))
+            for (d, coin), h, p in zip(long_df.index, long_df['holdings'], long_df['price'])
+        ]
+        total_rows = [
+            (self.account_id, d.isoformat(), float(v), day_hashes.get(d))
+            for d, v in total_value.items()
+        ]
+        with self._lock, connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO holdings_snapshots (account_id, date, coin_id, holdings, price) "
+                "VALUES (?, ?, ?, ?, ?)",
+                holding_rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO portfolio_snapshots (account_id, date, total_value, trades_hash) "
+                "VALUES (?, ?, ?, ?)",
+                total_rows,
+            )
+
+    def read_matrices(self, since=None):
+        """Holding dan harga hari tersimpan (mulai `since` jika diberikan) sebagai dua DataFrame lebar (date x coin).
+
+        Koin dengan holding nol tidak disimpan, jadi holding diisi 0 dan harganya NaN.
+        """
+        since = (since or date.min).isoformat()
+        with connect(self.path) as conn:
+            long_df = pd.read_sql_query(
+                "SELECT date, coin_id, holdings, price FROM holdings_snapshots WHERE account_id = ? AND date >= ? ORDER BY date",
+                conn, params=(self.account_id, since),
+            )
+        if long_df.empty:
+            return pd.DataFrame(dtype=float), pd.DataFrame(dtype=float)
+        long_df['date'] = pd.to_datetime(long_df['date']).dt.date
+        holdings_df = long_df.pivot(index='date', columns='coin_id', values='holdings').fillna(0.0)
+        prices_df = long_df.pivot(index='date', columns='coin_id', values='price')
+        # Hari tanpa holding sama sekali tidak punya baris; lengkapi dari tabel total
+        days = self.read_totals()
+        days = days.index[days.index >= date.fromisoformat(since)]
+        return holdings_df.reindex(days, fill_value=0.0), prices_df.reindex(days)
+
+    def read_totals(self):
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT date, total_value FROM portfolio_snapshots WHERE account_id = ? ORDER BY date", (self.account_id,)
+            ).fetchall()
+        series = pd.Series(
+            [v for _, v in rows], index=[date.fromisoformat(d) for d, _ in rows], dtype=float
+        )
+        series.index.name = 'date'
+        return series
+
+
+def dashboard_data_key(trades, positions, futures_balance):
+    """Sidik jari data input dashboard: id trade & posisi serta saldo dompet.
+
+    Snapshot dari worker hanya dipakai aplikasi jika kuncinya sama dengan data
+    sesi, jadi trade yang baru ditambahkan tidak tertutup snapshot lama.
+    """
+    digest = hashlib.sha1()
+    digest.update(",".join(str(t['id']) for t in trades).encode())
+    digest.update(b"|")
+    digest.update(",".join(str(p['id']) for p in positions).encode())
+    digest.update(f"|{float(futures_balance):.8f}".encode())
+    return digest.hexdigest()
+
+
+def _encode_state(state):
+    return {
+        key: {'frame': value.to_json(orient='split'), 'index': value.index.name}
+        if isinstance(value, pd.DataFrame) else float(value)
+        for key, value in state.items()
+    }
+
+
+def _decode_state(payload):
+    state = {}
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            value = pd.read_json(StringIO(value['frame']), orient='split').rename_axis(value['index'])
+        state[key] = value
+    return state
+
+
+class EquitySnapshotStore:
+    """Deret waktu snapshot dashboard (spot, futures, total) yang ditulis oleh snapshot_worker.
+
+    Setiap baris menyimpan angka ringkas sebagai kolom dan hasil lengkap
+    `calculate_dashboard` per metode cost basis sebagai JSON, sehingga
+    aplikasi bisa menampilkan dashboard hanya dengan satu baca lokal.
+    Satu store menampung semua akun; setiap method di-scope dengan `account_id`.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        _create_schema(self.path)
+
+    def append(self, states, data_key, account_id=DEFAULT_ACCOUNT_ID, ts=None):
+        """Menyimpan `states` (dict metode -> hasil calculate_dashboard); angka ringkasnya sama untuk semua metode."""
+        ts = int(ts if ts is not None else time.time())
+        first = next(iter(states.values()))
+        payload = json.dumps({method: _encode_state(state) for method, state in states.items()})
+        with self._lock, connect(self.path) as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO equity_snapshots (account_id, ts, data_key, {', '.join(EQUITY_COLUMNS)}, state) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(EQUITY_COLUMNS))}, ?)",
+                (account_id, ts, data_key, *(float(first[c]) for c in EQUITY_COLUMNS), payload),
+            )
+
+    def latest(self, account_id=DEFAULT_ACCOUNT_ID):
+        """(timestamp, data_key, states per metode) dari snapshot terbaru akun, atau None."""
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT ts, data_key, state FROM equity_snapshots WHERE account_id = ? ORDER BY ts DESC LIMIT 1",
+                (account_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        ts, data_key, payload = row
+        return ts, data_key, {method: _decode_state(state) for method, state in json.loads(payload).items()}
+
+    def series(self, account_id=DEFAULT_ACCOUNT_ID, since_ts=None):
+        """Angka ringkas semua snapshot akun sebagai DataFrame dengan index waktu (UTC)."""
+        with connect(self.path) as conn:
+            series_df = pd.read_sql_query(
+                f"SELECT ts, {', '.join(EQUITY_COLUMNS)} FROM equity_snapshots "
+                "WHERE account_id = ? AND ts >= ? ORDER BY ts",
+                conn, params=(account_id, int(since_ts or 0)),
+            )
+        series_df.index = pd.to_datetime(series_df.pop('ts'), unit='s')
+        series_df.index.name = 'time'
+        return series_df
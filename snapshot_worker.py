@@ -0,0 +1,124 @@
+"""Worker snapshot: menghitung state dashboard secara berkala di luar Streamlit.
+
+    python snapshot_worker.py                    # loop, tiap SNAPSHOT_INTERVAL detik
+    python snapshot_worker.py --once             # satu snapshot lalu keluar
+    python snapshot_worker.py --interval 30      # cadence lain
+    python snapshot_worker.py --local-db db.sqlite3
+
+Kredensial diambil dari env SUPABASE_URL / SUPABASE_KEY; tanpa itu dipakai
+SQLite lokal (LocalSupabase). API key CoinGecko dari COINGECKO_API_KEY atau
+COINGECKO_DEMO_API_KEY. Snapshot ditulis ke EquitySnapshotStore di file yang
+sama dengan price store (PRICE_STORE_PATH), yang juga dibaca aplikasi.
+Semua akun di tabel 'accounts' di-snapshot dalam satu siklus dengan satu
+pengambilan harga live untuk gabungan koinnya.
+"""
+import argparse
+import logging
+import os
+import time
+
+import streamlit.logger
+
+import analysis_engine as engine
+from accounts import AccountBook, load_accounts, load_wallet_balances
+from market_data import MarketDataClient, fetch_live_prices
+from snapshot_store import EquitySnapshotStore, dashboard_data_key
+
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "60"))
+
+log = logging.getLogger("snapshot_worker")
+
+
+def make_client(local_db=None):
+    """Klien Supabase asli jika kredensial ada, selain itu SQLite lokal."""
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    if url and key and not local_db:
+        from supabase import create_client
+        return create_client(url, key)
+    from local_supabase import DEFAULT_LOCAL_DB_PATH, LocalSupabase
+    return LocalSupabase(local_db or DEFAULT_LOCAL_DB_PATH)
+
+
+class SnapshotWorker:
+    """Satu siklus = sync tabel semua akun, harga live, ringkasan spot per metode, futures, lalu simpan snapshot.
+
+    Mirror tabel dan ledger cost basis per akun disimpan antar siklus, jadi
+    setiap siklus hanya memproses baris baru.
+    """
+
+    def __init__(self, client, cg_client, store=None):
+        self.client = client
+        self.cg = cg_client
+        self.store = store or EquitySnapshotStore()
+        self.book = AccountBook(client)
+
+    def run_once(self):
+        started = time.monotonic()
+        account_ids = [account['id'] for account in load_accounts(self.client)]
+        balances = load_wallet_balances(self.client)
+        data = self.book.sync_all(account_ids)
+
+        summaries, coins = {}, set()
+        for account_id, (trades, version, positions) in data.items():
+            summaries[account_id] = {
+                method: self.book.spot_summary(account_id, method, trades, version)
+                for method in engine.COST_BASIS_METHODS
+            }
+            coins.update(engine.dashboard_coins(summaries[account_id][engine.COST_BASIS_METHODS[0]], positions))
+        # Satu request harga untuk gabungan koin semua akun
+        live_prices = fetch_live_prices(self.cg, sorted(coins)) if coins else {}
+
+        ts = time.time()
+        snapshots = {}
+        for account_id, (trades, _, positions) in data.items():
+            balance = balances.get(account_id, 0.0)
+            states = {
+                method: engine.calculate_dashboard(summary_df, positions, balance, live_prices)
+                for method, summary_df in summaries[account_id].items()
+            }
+            self.store.append(states, dashboard_data_key(trades, positions, balance), account_id=account_id, ts=ts)
+            snapshots[account_id] = states
+        total = sum(next(iter(states.values()))['grand_total'] for states in snapshots.values())
+        log.info("snapshot: %d akun, %d koin, total $%s (%.2fs)",
+                 len(snapshots), len(coins), f"{total:,.2f}", time.monotonic() - started)
+        return snapshots
+
+    def run_forever(self, interval=SNAPSHOT_INTERVAL):
+        """Cadence tetap: jadwal berikutnya dihitung dari jadwal sebelumnya, bukan dari akhir siklus."""
+        next_run = time.monotonic()
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("snapshot gagal; dicoba lagi di siklus berikutnya")
+            next_run += interval
+            delay = next_run - time.monotonic()
+            if delay < 0:
+                # Siklus lebih lama dari interval: lewati jadwal yang tertinggal
+                next_run = time.monotonic()
+                delay = 0
+            time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interval', type=float, default=SNAPSHOT_INTERVAL, help="detik antar snapshot")
+    parser.add_argument('--once', action='store_true', help="satu snapshot lalu keluar")
+    parser.add_argument('--local-db', help="pakai file SQLite lokal sebagai pengganti Supabase")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    streamlit.logger.set_log_level("error")
+    cg = MarketDataClient(
+        api_key=os.environ.get("COINGECKO_API_KEY", ""),
+        demo_api_key=os.environ.get("COINGECKO_DEMO_API_KEY", ""),
+    )
+    worker = SnapshotWorker(make_client(args.local_db), cg)
+    if args.once:
+        worker.run_once()
+    else:
+        worker.run_forever(args.interval)
+
+
+if __name__ == '__main__':
+    main()
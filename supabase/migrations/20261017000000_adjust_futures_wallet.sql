@@ -0,0 +1,21 @@
+-- Mengubah saldo futures_wallet secara atomik dalam satu round trip.
+-- Baris dompet dibuat jika belum ada; saldo tidak boleh menjadi negatif.
+create or replace function adjust_futures_wallet(p_wallet_id bigint, p_delta numeric)
+returns numeric
+language plpgsql
+as $$
+declare
+    new_balance numeric;
+begin
+    insert into futures_wallet (id, balance)
+    values (p_wallet_id, p_delta)
+    on conflict (id) do update set balance = futures_wallet.balance + excluded.balance
+    returning balance into new_balance;
+
+    if new_balance < 0 then
+        raise exception 'Saldo futures wallet tidak cukup (%).', new_balance - p_delta
+            using errcode = 'check_violation';
+    end if;
+    return new_balance;
+end;
+$$;
@@ -0,0 +1,39 @@
+-- Sub-account: setiap trade spot, posisi futures dan dompet futures milik satu akun.
+-- Baris yang sudah ada menjadi milik akun bawaan (id 1); dompet akun N memakai id N.
+create table if not exists accounts (
+    id   bigint primary key,
+    name text not null unique
+);
+insert into accounts (id, name) values (1, 'Main') on conflict (id) do nothing;
+
+alter table spot_trades add column if not exists account_id bigint not null default 1 references accounts (id);
+alter table futures_positions add column if not exists account_id bigint not null default 1 references accounts (id);
+alter table futures_wallet add column if not exists account_id bigint not null default 1 references accounts (id);
+
+-- Sync bertahap memakai "where account_id = ? and id > ? order by id limit N",
+-- jadi index gabungan (account_id, id) melayani filter dan urutan sekaligus.
+create index if not exists spot_trades_account_id_idx on spot_trades (account_id, id);
+create index if not exists futures_positions_account_id_idx on futures_positions (account_id, id);
+create unique index if not exists futures_wallet_account_id_key on futures_wallet (account_id);
+
+-- adjust_futures_wallet sekarang per akun (nama parameter berubah, jadi fungsi lama dibuang).
+drop function if exists adjust_futures_wallet(bigint, numeric);
+create function adjust_futures_wallet(p_account_id bigint, p_delta numeric)
+returns numeric
+language plpgsql
+as $$
+declare
+    new_balance numeric;
+begin
+    insert into futures_wallet (id, account_id, balance)
+    values (p_account_id, p_account_id, p_delta)
+    on conflict (account_id) do update set balance = futures_wallet.balance + excluded.balance
+    returning balance into new_balance;
+
+    if new_balance < 0 then
+        raise exception 'Saldo futures wallet tidak cukup (%).', new_balance - p_delta
+            using errcode = 'check_violation';
+    end if;
+    return new_balance;
+end;
+$$;
@@ -0,0 +1,145 @@
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from instrumentation import metrics
+
+# Harus <= batas 'max rows' Supabase (default 1000), kalau tidak halaman akan terpotong diam-diam.
+PAGE_SIZE = 1000
+RECONCILE_INTERVAL = 300
+# Akun bawaan: nilai default kolom account_id (lihat supabase/migrations)
+DEFAULT_ACCOUNT_ID = 1
+# Kolom yang menentukan identitas sebuah trade (tanpa id database)
+TRADE_KEY_COLUMNS = ('date', 'coin', 'type', 'amount', 'price_per_coin')
+
+
+def parse_trade_dates(rows):
+    """Mengubah kolom 'date' (string YYYY-MM-DD) menjadi objek date sekaligus untuk satu batch."""
+    dates = pd.to_datetime(pd.Series([row['date'] for row in rows]), format='%Y-%m-%d').dt.date
+    for row, parsed in zip(rows, dates):
+        row['date'] = parsed
+    return rows
+
+
+def trade_fingerprints(trades_df, columns=TRADE_KEY_COLUMNS):
+    """Sidik jari uint64 per trade dari `columns`, stabil antara file import, database dan engine.
+
+    Tanggal dinormalisasi ke hari dan angka dibulatkan ke 8 desimal agar nilai
+    dari sumber yang berbeda tetap cocok.
+    """
+    if trades_df.empty:
+        return pd.Series(dtype='uint64')
+    key_df = pd.DataFrame(index=trades_df.index)
+    for column in columns:
+        if column == 'date':
+            # Unit datetime64 berbeda antar sumber (s/us); hash memakai nilai integernya
+            key_df[column] = pd.to_datetime(trades_df[column]).dt.normalize().dt.as_unit('s')
+        elif column in ('amount', 'price_per_coin'):
+            key_df[column] = pd.to_numeric(trades_df[column]).astype(float).round(8)
+        else:
+            key_df[column] = trades_df[column].astype(str)
+    return pd.util.hash_pandas_object(key_df, index=False)
+
+
+class TableMirror:
+    """Salinan lokal satu tabel Supabase yang disinkronkan bertahap dengan cursor `id`.
+
+    `sync()` hanya mengambil baris dengan id > cursor, per halaman, sehingga
+    tabel besar tidak terpotong oleh batas baris Supabase. Insert dan delete
+    yang dilakukan aplikasi ini langsung diterapkan ke mirror tanpa query ulang;
+    `reconcile()` sesekali mencocokkan daftar id untuk menangkap delete dari luar.
+    `filters` (mis. {'account_id': 3}) dipasang sebagai `eq` di setiap query,
+    sehingga satu mirror hanya berisi baris satu akun.
+    """
+
+    def __init__(self, client, table, transform=None, filters=None, page_size=PAGE_SIZE,
+                 reconcile_interval=RECONCILE_INTERVAL):
+        self.client = client
+        self.table = table
+        self.transform = transform
+        self.filters = dict(filters or {})
+        self.page_size = page_size
+        self.reconcile_interval = reconcile_interval
+        self.cursor = 0
+        self.version = 0
+        self._token = uuid.uuid4().hex
+        self._rows = {}
+        self._last_reconcile = time.monotonic()
+        self._lock = threading.RLock()
+
+    def _query(self, columns="*"):
+        query = self.client.table(self.table).select(columns)
+        for column, value in self.filters.items():
+            query = query.eq(column, value)
+        return query
+
+    def _apply(self, rows, advance_cursor=True):
+        if not rows:
+            return
+        if self.transform is not None:
+            rows = self.transform(rows)
+        for row in rows:
+            self._rows[row['id']] = row
+        if advance_cursor:
+            self.cursor = max(self.cursor, max(row['id'] for row in rows))
+        self.version += 1
+
+    def sync(self):
+        """Menerapkan baris baru sejak sync terakhir, lalu mengembalikan semua record."""
+        with self._lock, metrics.span(f"supabase.{self.table}.sync"):
+            while True:
+                page = self._query().gt('id', self.cursor).order('id').limit(self.page_size).execute().data
+                metrics.incr(f"supabase.{self.table}.pages")
+                self._apply(page)
+                if len(page) < self.page_size:
+                    break
+            if time.monotonic() - self._last_reconcile > self.reconcile_interval:
+                self.reconcile()
+            return self.records()
+
+    def reconcile(self):
+        """Membuang baris lokal yang sudah dihapus di database oleh klien lain."""
+        with self._lock, metrics.span(f"supabase.{self.table}.reconcile"):
+            remote_ids, after = set(), 0
+            while True:
+                page = self._query("id").gt('id', after).order('id').limit(self.page_size).execute().data
+                remote_ids.update(row['id'] for row in page)
+                if len(page) < self.page_size:
+                    break
+                after = page[-1]['id']
+            stale_ids = self._rows.keys() - remote_ids
+            for row_id in stale_ids:
+                del self._rows[row_id]
+            if stale_ids:
+                self.version += 1
+            self._last_reconcile = time.monotonic()
+
+    def apply_inserted(self, rows):
+        """Menerapkan baris hasil `insert(...).execute().data` tanpa membaca ulang tabel.
+
+        Cursor tidak dimajukan agar insert dari klien lain dengan id lebih kecil
+        tetap terambil pada sync berikutnya.
+        """
+        with self._lock:
+            self._apply([dict(row) for row in rows], advance_cursor=False)
+
+    def remove(self, row_id):
+        with self._lock:
+            if self._rows.pop(row_id, None) is not None:
+                self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self.version += 1
+
+    @property
+    def state_key(self):
+        """Kunci unik untuk isi mirror saat ini; cocok dipakai sebagai kunci cache."""
+        return f"{self._token}:{self.version}"
+
+    def records(self):
+        with self._lock:
+            return [self._rows[row_id] for row_id in sorted(self._rows)]
@@ -1,29 +1,93 @@
+import os
+import time
 import streamlit as st
-from pycoingecko import CoinGeckoAPI
+from instrumentation import metrics
+
+_script_started = time.perf_counter()
+
+# 0. --- ===================================================== ---
+# --- KERANGKA HALAMAN: digambar paling awal, sebelum import berat
+# --- (pandas, engine, plotly, supabase), koneksi, maupun query apa pun.
+# --- Setiap bagian mendapat slot "Loading..." yang diisi bertahap di bawah.
+# --- ===================================================== ---
+st.set_page_config(page_title="My Crypto Tracker", page_icon="🚀", layout="wide")
+st.title("🚀 My Supercharged Crypto Tracker (Phase 11.3)")
+
+def section_slot():
+    slot = st.empty()
+    slot.caption("Loading...")
+    return slot
+
+slots = {}
+slots['global_market'] = section_slot()
+st.divider()
+if st.session_state.get('show_consolidated'):
+    slots['consolidated'] = section_slot()
+    st.divider()
+slots['total_value'] = section_slot()
+st.divider()
+slots['spot_portfolio'] = section_slot()
+st.divider()
+slots['futures_positions'] = section_slot()
+slots['futures_stress_test'] = section_slot()
+st.divider()
+slots['spot_history'] = section_slot()
+st.divider()
+slots['spot_analytics'] = section_slot()
+st.divider()
+form_col1, form_col2 = st.columns(2)
+with form_col1:
+    slots['spot_trade_form'] = section_slot()
+with form_col2:
+    slots['futures_form'] = section_slot()
+st.divider()
+slots['trade_import'] = section_slot()
+st.divider()
+slots['wallet_management'] = section_slot()
+st.divider()
+slots['trade_log'] = section_slot()
+st.divider()
+slots['danger_zone'] = section_slot()
+if st.session_state.get('show_performance'):
+    st.divider()
+    slots['performance'] = section_slot()
+metrics.record("render.skeleton", time.perf_counter() - _script_started)
+
+# --- Modul berat baru dimuat setelah kerangka tampil; plotly, supabase,
+# --- analytics dan trade_import di-import di dalam bagian yang memakainya.
+from datetime import datetime, timedelta
 import pandas as pd
-from datetime import datetime
-import plotly.express as px
 import analysis_engine as engine
-from supabase import create_client, Client
+from accounts import DEFAULT_ACCOUNTS, AccountBook, load_accounts, load_wallet_balances
+from market_data import LivePriceCache, MarketDataClient, call_with_backoff, fetch_concurrently, fetch_live_prices
+from snapshot_store import EquitySnapshotStore, dashboard_data_key
+from table_sync import DEFAULT_ACCOUNT_ID
 
 # --- ====================================================== ---
 # --- KUNCI DIAMBIL DARI STREAMLIT SECRETS (AMAN) ---
 # --- ====================================================== ---
-try:
-    SUPABASE_URL = st.secrets["SUPABASE_URL"]
-    SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-except KeyError:
-    st.error("ERROR: Supabase URL/Key tidak ditemukan. Atur di 'Settings > Secrets' di Streamlit Cloud.")
-    st.stop()
+# LOCAL_DB_PATH: pakai SQLite lokal (LocalSupabase) sebagai pengganti Supabase
+LOCAL_DB_PATH = os.environ.get("LOCAL_DB_PATH")
+if LOCAL_DB_PATH:
+    SUPABASE_URL = SUPABASE_KEY = None
+else:
+    try:
+        SUPABASE_URL = st.secrets["SUPABASE_URL"]
+        SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
+    except KeyError:
+        st.error("ERROR: Supabase URL/Key tidak ditemukan. Atur di 'Settings > Secrets' di Streamlit Cloud.")
+        st.stop()
 # --- ====================================================== ---
 
-# --- ID DOMPET FUTURES (Kita anggap hanya ada 1 baris di tabel wallet) ---
-FUTURES_WALLET_ID = 1 
-
 # --- KONEKSI KE SUPABASE ---
 @st.cache_resource
 def init_supabase_client():
     try:
+        if LOCAL_DB_PATH:
+            from local_supabase import LocalSupabase
+            return LocalSupabase(LOCAL_DB_PATH)
+        # supabase-py cukup berat; hanya dimuat sekali per proses, saat klien pertama dibuat
+        from supabase import create_client
         client = create_client(SUPABASE_URL, SUPABASE_KEY)
         return client
     except Exception as e:
@@ -32,31 +96,54 @@ def init_supabase_client():
 
 client = init_supabase_client()
 
+# --- AKUN: semua data di-scope dengan account_id; akun aktif dipilih di sidebar ---
+def current_account():
+    return st.session_state.get('account_id', DEFAULT_ACCOUNT_ID)
+
+@metrics.cached('accounts', st.cache_data(ttl=60))
+def load_account_list():
+    try:
+        return load_accounts(client)
+    except Exception as e:
+        st.error(f"Error membaca 'accounts': {e}")
+        return list(DEFAULT_ACCOUNTS)
+
+# --- MIRROR LOKAL TABEL per akun (sync bertahap, dipakai bersama semua sesi) ---
+@st.cache_resource
+def get_account_book():
+    return AccountBook(client)
+
+def get_trades_mirror():
+    return get_account_book().trades_mirror(current_account())
+
+def get_futures_mirror():
+    return get_account_book().futures_mirror(current_account())
+
 # --- FUNGSI DATABASE (v11.1) ---
+def db_execute(name, query):
+    """Menjalankan query Supabase sebagai satu span bernama 'supabase.<name>'."""
+    with metrics.span(f"supabase.{name}"):
+        return query.execute()
+
 def load_trades():
-    """Mengambil semua trade dari tabel 'spot_trades'."""
+    """Mengambil trade dari 'spot_trades' (hanya baris baru sejak sync terakhir)."""
     try:
-        response = client.table('spot_trades').select("*").execute()
-        data = response.data
-        for trade in data:
-            trade['date'] = datetime.strptime(trade['date'], '%Y-%m-%d').date()
-        return data
+        return get_trades_mirror().sync()
     except Exception as e:
         st.error(f"Error membaca 'spot_trades': {e}"); return []
 
 def load_futures_positions():
-    """Mengambil semua posisi dari tabel 'futures_positions'."""
+    """Mengambil posisi dari 'futures_positions' (hanya baris baru sejak sync terakhir)."""
     try:
-        response = client.table('futures_positions').select("*").execute()
-        return response.data
+        return get_futures_mirror().sync()
     except Exception as e:
         st.error(f"Error membaca 'futures_positions': {e}"); return []
 
-@st.cache_data(ttl=10)
-def load_futures_wallet_balance():
-    """Mengambil saldo 'tersedia' dari tabel 'futures_wallet'."""
+@metrics.cached('futures_wallet', st.cache_data(ttl=10))
+def load_futures_wallet_balance(account_id):
+    """Mengambil saldo 'tersedia' akun dari tabel 'futures_wallet'."""
     try:
-        response = client.table('futures_wallet').select("balance").eq('id', FUTURES_WALLET_ID).execute()
+        response = db_execute('futures_wallet.select', client.table('futures_wallet').select("balance").eq('account_id', account_id))
         if response.data:
             return response.data[0]['balance']
         else:
@@ -65,262 +152,501 @@ def load_futures_wallet_balance():
         st.error(f"Error membaca 'futures_wallet': {e}")
         return 0.0
 
-def update_futures_wallet_balance(new_balance):
-    """Meng-update saldo 'tersedia' di tabel 'futures_wallet'."""
+def adjust_futures_wallet_balance(delta):
+    """Menambah/mengurangi saldo dompet secara atomik (fungsi SQL `adjust_futures_wallet`).
+
+    Satu round trip; mengembalikan saldo baru, atau None jika gagal (mis. saldo tidak cukup).
+    """
     try:
-        response = client.table('futures_wallet').select("id").eq('id', FUTURES_WALLET_ID).execute()
-        if response.data:
-            client.table('futures_wallet').update({"balance": new_balance}).eq('id', FUTURES_WALLET_ID).execute()
-        else:
-            client.table('futures_wallet').insert({"id": FUTURES_WALLET_ID, "balance": new_balance}).execute()
-        st.cache_data.clear() 
+        response = db_execute('futures_wallet.adjust', client.rpc(
+            'adjust_futures_wallet', {'p_account_id': current_account(), 'p_delta': delta}
+        ))
+        new_balance = float(response.data)
     except Exception as e:
         st.error(f"Error meng-update 'futures_wallet': {e}")
+        return None
+    # Hanya entri cache saldo dompet yang dibuang; cache harga & pasar tetap utuh
+    load_futures_wallet_balance.clear()
+    load_all_wallet_balances.clear()
+    return new_balance
+
+def set_futures_wallet_balance(new_balance):
+    """Menyetel saldo ke nilai tertentu dengan satu upsert; mengembalikan saldo baru atau None."""
+    try:
+        # Dompet akun N memakai id N (lihat migrasi account_scoping)
+        response = db_execute('futures_wallet.upsert', client.table('futures_wallet').upsert(
+            {"id": current_account(), "account_id": current_account(), "balance": new_balance}
+        ))
+        new_balance = float(response.data[0]['balance'])
+    except Exception as e:
+        st.error(f"Error meng-update 'futures_wallet': {e}")
+        return None
+    load_futures_wallet_balance.clear()
+    load_all_wallet_balances.clear()
+    return new_balance
+
+@metrics.cached('futures_wallets', st.cache_data(ttl=10))
+def load_all_wallet_balances():
+    """Saldo dompet semua akun dalam satu query, untuk tampilan gabungan."""
+    try:
+        with metrics.span("supabase.futures_wallet.select_all"):
+            return load_wallet_balances(client)
+    except Exception as e:
+        st.error(f"Error membaca 'futures_wallet': {e}")
+        return {}
+
+# 1. --- Initialize API Client (pool koneksi bersama, tanpa ping saat start) ---
+@st.cache_resource
+def init_market_data_client():
+    return MarketDataClient(
+        api_key=st.secrets.get("COINGECKO_API_KEY", ""),
+        demo_api_key=st.secrets.get("COINGECKO_DEMO_API_KEY", ""),
+    )
 
-# 1. --- Initialize API Client ---
-try:
-    cg = CoinGeckoAPI(); cg.ping() 
-except Exception as e:
-    st.error(f"Error connecting to CoinGecko API: {e}"); st.stop()
+cg = init_market_data_client()
+
+# --- Cache harga live bersama untuk semua sesi dan semua akun (TTL + single-flight per koin) ---
+@st.cache_resource
+def get_live_price_cache():
+    return LivePriceCache(lambda coins: fetch_live_prices(cg, coins))
 
 # --- ====================================================== ---
 # --- FUNGSI BARU v11.3: Ambil Data Grafik Global ---
 # --- ====================================================== ---
-@st.cache_data(ttl=600) # Cache data ini selama 10 menit
+@metrics.cached('global_market', st.cache_data(ttl=600)) # Cache data ini selama 10 menit
 def get_global_market_data():
     """Mengambil data harga BTC (7h) dan Dominasi BTC (30h)."""
+    # Ketiga permintaan independen, jadi dijalankan bersamaan
+    now = datetime.now()
+    requests_to_run = {
+        # 1. Harga BTC 7 hari (interval per jam)
+        'btc_7d': lambda: call_with_backoff(cg.get_coin_market_chart_by_id, 'bitcoin', 'usd', 7),
+        # 2. Market cap BTC 30 hari (interval harian) + market cap global, untuk dominasi
+        'btc_30d': lambda: call_with_backoff(cg.get_coin_market_chart_by_id, 'bitcoin', 'usd', 30),
+        'global': lambda: call_with_backoff(
+            cg.get_global_market_chart_range,
+            from_timestamp=int((now - pd.Timedelta(days=30)).timestamp()),
+            to_timestamp=int(now.timestamp()),
+        ),
+    }
+    results, errors = fetch_concurrently(lambda name: requests_to_run[name](), list(requests_to_run))
+    for name, e in errors.items():
+        st.warning(f"Gagal mengambil data pasar global ({name}): {e}")
+
+    price_df = pd.DataFrame(); dom_df = pd.DataFrame()
     try:
-        # 1. Ambil data harga BTC 7 hari (interval per jam)
-        btc_price_data = cg.get_coin_market_chart_by_id('bitcoin', 'usd', 7)
-        price_df = pd.DataFrame(btc_price_data['prices'], columns=['timestamp', 'price'])
-        price_df['date'] = pd.to_datetime(price_df['timestamp'], unit='ms')
-        
-        # 2. Ambil data Dominasi BTC 30 hari (interval harian)
-        # Kita perlu mengambil 'market_caps' untuk ini
-        btc_dom_data = cg.get_coin_market_chart_by_id('bitcoin', 'usd', 30)
-        dom_df = pd.DataFrame(btc_dom_data['market_caps'], columns=['timestamp', 'market_cap_btc'])
-        
-        global_data = cg.get_global_market_chart_range(
-            from_timestamp=(datetime.now() - pd.Timedelta(days=30)).timestamp(),
-            to_timestamp=datetime.now().timestamp()
-        )
-        global_mcap_df = pd.DataFrame(global_data['market_caps'], columns=['timestamp', 'market_cap_global'])
-
-        # Gabungkan data dominasi
-        dom_df = pd.merge(dom_df, global_mcap_df, on='timestamp', how='inner')
-        dom_df['date'] = pd.to_datetime(dom_df['timestamp'], unit='ms')
-        dom_df['btc_dominance'] = (dom_df['market_cap_btc'] / dom_df['market_cap_global']) * 100
-        
-        return price_df, dom_df
-
+        if 'btc_7d' in results:
+            price_df = pd.DataFrame(results['btc_7d']['prices'], columns=['timestamp', 'price'])
+            price_df['date'] = pd.to_datetime(price_df['timestamp'], unit='ms')
+
+        if 'btc_30d' in results and 'global' in results:
+            dom_df = pd.DataFrame(results['btc_30d']['market_caps'], columns=['timestamp', 'market_cap_btc'])
+            global_mcap_df = pd.DataFrame(results['global']['market_caps'], columns=['timestamp', 'market_cap_global'])
+
+            # Gabungkan data dominasi
+            dom_df = pd.merge(dom_df, global_mcap_df, on='timestamp', how='inner')
+            dom_df['date'] = pd.to_datetime(dom_df['timestamp'], unit='ms')
+            dom_df['btc_dominance'] = (dom_df['market_cap_btc'] / dom_df['market_cap_global']) * 100
     except Exception as e:
-        st.warning(f"Gagal mengambil data pasar global: {e}")
-        return pd.DataFrame(), pd.DataFrame()
+        st.warning(f"Gagal mengolah data pasar global: {e}")
+
+    return price_df, dom_df
 
 # 2. --- Initialize Session State ---
-if 'trades' not in st.session_state:
+def refresh_trades():
     st.session_state.trades = load_trades()
-if 'futures_positions' not in st.session_state:
+    st.session_state.trades_version = get_trades_mirror().state_key
+    st.session_state.history_chart = None
+    st.session_state.analytics_report = None
+
+def refresh_futures_positions():
     st.session_state.futures_positions = load_futures_positions()
+    st.session_state.positions_version = get_futures_mirror().state_key
+
+def switch_account():
+    """Dipanggil saat akun di sidebar diganti: semua data sesi dimuat ulang untuk akun baru."""
+    refresh_trades()
+    refresh_futures_positions()
+    st.session_state.futures_balance = load_futures_wallet_balance(current_account())
+    st.session_state.import_result = None
+
+if 'account_id' not in st.session_state:
+    st.session_state.account_id = load_account_list()[0]['id']
+if 'trades' not in st.session_state:
+    refresh_trades()
+if 'futures_positions' not in st.session_state:
+    refresh_futures_positions()
 if 'futures_balance' not in st.session_state:
-    st.session_state.futures_balance = load_futures_wallet_balance()
-
-# --- (Kalkulasi Portofolio Anda tidak berubah) ---
-total_spot_value = 0.0; total_spot_pl = 0.0
-summary_df = pd.DataFrame(); portfolio_coins = []; futures_coins = []
-available_futures_balance = st.session_state.futures_balance
-total_futures_margin_used = 0.0
-total_futures_pnl = 0.0
-futures_df = pd.DataFrame()
-
-if st.session_state.trades:
-    df = pd.DataFrame(st.session_state.trades)
-    df['Amount'] = pd.to_numeric(df['amount'])
-    df['Total Cost (USD)'] = pd.to_numeric(df['total_cost_usd'])
-    buys = df[df['type'] == 'Buy']; sells = df[df['type'] == 'Sell']
-    buy_summary = buys.groupby('coin')['Amount'].sum()
-    sell_summary = sells.groupby('coin')['Amount'].sum()
-    holdings_df = (buy_summary.subtract(sell_summary, fill_value=0)).to_frame(name="Holdings")
-    holdings_df = holdings_df[holdings_df['Holdings'] > 0.000001]
-    total_buy_cost = buys.groupby('coin')['Total Cost (USD)'].sum()
-    total_buy_amount = buys.groupby('coin')['Amount'].sum()
-    avg_buy_cost_df = (total_buy_cost / total_buy_amount).to_frame(name="Avg. Buy Price")
-    summary_df = pd.merge(holdings_df, avg_buy_cost_df, left_index=True, right_index=True, how='left')
-    portfolio_coins = summary_df.index.unique().tolist()
-
-if st.session_state.futures_positions:
-    futures_coins = list(set([pos['coin_id'] for pos in st.session_state.futures_positions]))
-    total_futures_margin_used = sum(pos['margin'] for pos in st.session_state.futures_positions)
-
-all_coins = list(set(portfolio_coins + futures_coins + ['tether']))
-if all_coins:
+    st.session_state.futures_balance = load_futures_wallet_balance(current_account())
+
+# 3. --- Kalkulasi Portofolio (fungsi murni di engine, di-cache per versi data) ---
+def get_spot_summary(method):
+    """Ringkasan cost basis; ledger per (akun, metode) dipakai bersama semua sesi dan hanya menerima trade baru."""
+    with metrics.span(f"cost_basis.{method}"):
+        return get_account_book().spot_summary(
+            current_account(), method, st.session_state.trades, st.session_state.trades_version
+        )
+
+@metrics.cached('dashboard', st.cache_data(max_entries=32))
+def cached_dashboard(_summary_df, _positions, trades_version, cost_basis_method, positions_version, futures_balance, live_prices):
+    return engine.calculate_dashboard(_summary_df, _positions, futures_balance, live_prices)
+
+# --- Analitik risiko: satu state inkremental per set trade, dipakai bersama semua sesi ---
+ANALYTICS_MAX_STATES = 8
+
+@st.cache_resource
+def get_analytics_states():
+    return {}
+
+def get_portfolio_analytics(trades):
+    """Laporan analitik untuk set trade ini; hanya hari setelah yang sudah diproses yang dibaca dan dihitung."""
+    import analytics
+    states = get_analytics_states()
+    # Snapshot harga & holding di-scope per akun, jadi akun ikut menjadi bagian kunci
+    key = (current_account(), analytics.trades_key(trades))
+    if key not in states:
+        while len(states) >= ANALYTICS_MAX_STATES:
+            states.pop(next(iter(states)))
+        states[key] = analytics.AnalyticsState()
+    state = states[key]
+    matrices_from = state.last_date + timedelta(days=1) if state.last_date is not None else None
+    _, holdings_df, prices_df = engine.calculate_portfolio_history(
+        trades, cg, with_matrices=True, account_id=current_account(), matrices_from=matrices_from
+    )
+    with metrics.span("analytics.update"):
+        return state.update(holdings_df, prices_df).report()
+
+# --- Snapshot dari snapshot_worker.py (opsional): dashboard cukup membaca SQLite lokal ---
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "180"))
+
+@st.cache_resource
+def get_equity_store():
+    return EquitySnapshotStore()
+
+@metrics.cached('worker_snapshot', st.cache_data(ttl=5))
+def load_latest_snapshot(account_id):
+    return get_equity_store().latest(account_id)
+
+def session_data_key():
+    """Kunci data sesi (lihat dashboard_data_key), dihitung ulang hanya saat data berubah."""
+    version = (st.session_state.trades_version, st.session_state.positions_version, st.session_state.futures_balance)
+    if st.session_state.get('data_key_version') != version:
+        st.session_state.data_key = dashboard_data_key(
+            st.session_state.trades, st.session_state.futures_positions, st.session_state.futures_balance
+        )
+        st.session_state.data_key_version = version
+    return st.session_state.data_key
+
+def get_worker_snapshot(method):
+    """(timestamp, state) jika snapshot worker masih segar dan dibuat dari data yang sama, selain itu None."""
+    snapshot = load_latest_snapshot(current_account())
+    if snapshot is None:
+        return None
+    ts, data_key, states = snapshot
+    if time.time() - ts > SNAPSHOT_MAX_AGE or method not in states or data_key != session_data_key():
+        return None
+    return ts, states[method]
+
+def get_dashboard_state():
+    """Angka dashboard untuk data sesi saat ini; dipanggil oleh setiap bagian (fragment)."""
+    method = st.session_state.get('cost_basis_method', engine.COST_BASIS_METHODS[0])
+    snapshot = get_worker_snapshot(method)
+    if snapshot is not None:
+        metrics.incr("dashboard.from_snapshot")
+        return snapshot[1]
+    summary_df = get_spot_summary(method)
+    all_coins = engine.dashboard_coins(summary_df, st.session_state.futures_positions)
+    all_live_prices = {}
     try:
-        price_data = cg.get_price(ids=all_coins, vs_currencies='usd')
-        all_live_prices = {coin: data.get('usd', 0) for coin, data in price_data.items()}
+        with metrics.span("live_prices.get"):
+            all_live_prices = get_live_price_cache().get_prices(all_coins)
     except Exception as e:
         st.error(f"Error fetching live prices: {e}")
-
-if not summary_df.empty:
-    summary_df['Live Price'] = summary_df.index.map(lambda coin: all_live_prices.get(coin, 0))
-    summary_df['Current Value (USD)'] = summary_df['Holdings'] * summary_df['Live Price']
-    summary_df['P/L (USD)'] = summary_df['Current Value (USD)'] - (summary_df['Holdings'] * summary_df['Avg. Buy Price'])
-    total_spot_value = summary_df['Current Value (USD)'].sum()
-    total_spot_pl = summary_df['P/L (USD)'].sum()
-
-if st.session_state.futures_positions:
-    positions_to_display = []
-    for pos in st.session_state.futures_positions:
-        live_price = 1.0 if pos['coin_id'] == 'tether' else all_live_prices.get(pos['coin_id'], 0)
-        pos_size_usd = pos['margin'] * pos['leverage']
-        pos_size_coins = pos_size_usd / pos['entry_price']
-        
-        if pos['direction'] == 'Long':
-            liq_price = pos['entry_price'] * (1 - (1 / pos['leverage']))
-            pnl_usd = (live_price - pos['entry_price']) * pos_size_coins
-        else:
-            liq_price = pos['entry_price'] * (1 + (1 / pos['leverage']))
-            pnl_usd = (pos['entry_price'] - live_price) * pos_size_coins
-        
-        pnl_perc = (pnl_usd / pos['margin']) * 100 if pos['margin'] != 0 else 0
-        total_futures_pnl += pnl_usd
-        
-        positions_to_display.append({
-            "DB_ID": pos['id'], "Coin": pos['coin_id'], "Direction": pos['direction'], "Size (USD)": pos_size_usd,
-            "Margin": pos['margin'], "Leverage": f"{pos['leverage']}x", "Entry Price": pos['entry_price'],
-            "Live Price": live_price, "P/L (USD)": pnl_usd, "P/L (%)": pnl_perc, "Liq. Price": liq_price
-        })
-    futures_df = pd.DataFrame(positions_to_display)
-
-total_futures_equity = available_futures_balance + total_futures_margin_used + total_futures_pnl
-grand_total = total_spot_value + total_futures_equity
+    return cached_dashboard(
+        summary_df, st.session_state.futures_positions,
+        st.session_state.trades_version, method, st.session_state.positions_version,
+        st.session_state.futures_balance, all_live_prices,
+    )
 
 # 4. --- ===================================================== ---
 # --- TAMPILAN APLIKASI v11.3 ---
+# --- Setiap bagian adalah fragment: interaksi di satu bagian hanya
+# --- menjalankan ulang bagian itu, bukan seluruh halaman.
 # --- ===================================================== ---
 
-st.set_page_config(page_title="My Crypto Tracker", page_icon="🚀", layout="wide")
-st.title("🚀 My Supercharged Crypto Tracker (Phase 11.3)")
-
 # --- ====================================================== ---
 # --- BAGIAN BARU v11.3: Dashboard Pasar Global ---
 # --- ====================================================== ---
-st.subheader("Global Market Overview")
-btc_price_chart_df, btc_dom_chart_df = get_global_market_data()
-
-chart_col1, chart_col2 = st.columns(2)
+@st.fragment
+@metrics.timed("render.section.global_market")
+def render_global_market():
+    import plotly.express as px
+    st.subheader("Global Market Overview")
+    btc_price_chart_df, btc_dom_chart_df = get_global_market_data()
+
+    chart_col1, chart_col2 = st.columns(2)
+
+    with chart_col1:
+        if not btc_price_chart_df.empty:
+            # Ambil harga BTC saat ini dari data
+            current_btc_price = btc_price_chart_df.iloc[-1]['price']
+            st.metric(label="Current Bitcoin Price", value=f"${current_btc_price:,.2f}")
+            
+            with metrics.span("render.chart.btc_price"):
+                fig_price = px.line(engine.downsample_lttb(btc_price_chart_df, 'price', x='date'), x='date', y='price', title='BTC Price (7-Day)')
+                fig_price.update_layout(xaxis_title=None, yaxis_title='Price (USD)', yaxis_tickprefix='$', yaxis_tickformat = ',.2f')
+                st.plotly_chart(fig_price, width='stretch')
+        else:
+            st.info("Tidak dapat memuat grafik harga BTC.")
+
+    with chart_col2:
+        if not btc_dom_chart_df.empty:
+            # Ambil dominasi BTC saat ini dari data
+            current_btc_dom = btc_dom_chart_df.iloc[-1]['btc_dominance']
+            st.metric(label="Current BTC Dominance", value=f"{current_btc_dom:.2f}%")
+            
+            with metrics.span("render.chart.btc_dominance"):
+                fig_dom = px.line(engine.downsample_lttb(btc_dom_chart_df, 'btc_dominance', x='date'), x='date', y='btc_dominance', title='BTC Dominance (30-Day)')
+                fig_dom.update_layout(xaxis_title=None, yaxis_title='Dominance (%)', yaxis_ticksuffix='%')
+                st.plotly_chart(fig_dom, width='stretch')
+        else:
+            st.info("Tidak dapat memuat grafik dominasi BTC.")
+# --- AKHIR BAGIAN BARU ---
 
-with chart_col1:
-    if not btc_price_chart_df.empty:
-        # Ambil harga BTC saat ini dari data
-        current_btc_price = btc_price_chart_df.iloc[-1]['price']
-        st.metric(label="Current Bitcoin Price", value=f"${current_btc_price:,.2f}")
-        
-        fig_price = px.line(btc_price_chart_df, x='date', y='price', title='BTC Price (7-Day)')
-        fig_price.update_layout(xaxis_title=None, yaxis_title='Price (USD)', yaxis_tickprefix='$', yaxis_tickformat = ',.2f')
-        st.plotly_chart(fig_price, width='stretch')
+@st.fragment
+@metrics.timed("render.section.total_value")
+def render_total_value():
+    state = get_dashboard_state()
+    st.subheader("Total Portfolio Value")
+    st.metric(label="Total Combined Equity (Spot + Futures)", value=f"${state['grand_total']:,.2f}", delta=f"${state['total_spot_pl'] + state['total_futures_pnl']:,.2f} (Total P/L)")
+    snapshot = get_worker_snapshot(st.session_state.get('cost_basis_method', engine.COST_BASIS_METHODS[0]))
+    if snapshot is not None:
+        st.caption(f"Dari snapshot worker, {time.time() - snapshot[0]:,.0f} detik lalu.")
     else:
-        st.info("Tidak dapat memuat grafik harga BTC.")
+        price_cache = get_live_price_cache()
+        price_age = price_cache.age(engine.dashboard_coins(state['summary_df'], st.session_state.futures_positions))
+        if price_cache.last_error is not None and price_age is not None:
+            st.warning(f"Harga live gagal diperbarui ({price_cache.last_error}); harga tertua berumur {price_age:,.0f} detik.")
+    equity_series = get_equity_store().series(current_account())
+    if len(equity_series) > 1:
+        import plotly.express as px
+        with st.expander("Recorded Equity History"):
+            with metrics.span("render.chart.recorded_equity"):
+                columns = ['grand_total', 'total_spot_value', 'total_futures_equity']
+                fig = px.line(engine.downsample_lttb(equity_series, columns), y=columns, title='Recorded Equity (snapshot worker)')
+                fig.update_layout(xaxis_title=None, yaxis_title='USD', yaxis_tickprefix='$', yaxis_tickformat=',.2f', legend_title=None)
+                st.plotly_chart(fig, width='stretch')
 
-with chart_col2:
-    if not btc_dom_chart_df.empty:
-        # Ambil dominasi BTC saat ini dari data
-        current_btc_dom = btc_dom_chart_df.iloc[-1]['btc_dominance']
-        st.metric(label="Current BTC Dominance", value=f"{current_btc_dom:.2f}%")
-        
-        fig_dom = px.line(btc_dom_chart_df, x='date', y='btc_dominance', title='BTC Dominance (30-Day)')
-        fig_dom.update_layout(xaxis_title=None, yaxis_title='Dominance (%)', yaxis_ticksuffix='%')
-        st.plotly_chart(fig_dom, width='stretch')
+@st.fragment
+@metrics.timed("render.section.spot_portfolio")
+def render_spot_portfolio():
+    state = get_dashboard_state()
+    summary_df = state['summary_df']
+    st.subheader("My Spot Portfolio")
+    if summary_df.empty:
+        st.info("Your spot portfolio is empty. Add trades below.")
     else:
-        st.info("Tidak dapat memuat grafik dominasi BTC.")
-st.divider()
-# --- AKHIR BAGIAN BARU ---
-
-st.subheader("Total Portfolio Value")
-st.metric(label="Total Combined Equity (Spot + Futures)", value=f"${grand_total:,.2f}", delta=f"${total_spot_pl + total_futures_pnl:,.2f} (Total P/L)")
-st.divider()
-
-st.subheader("My Spot Portfolio")
-if summary_df.empty:
-    st.info("Your spot portfolio is empty. Add trades below.")
-else:
-    st.metric(label="Total Spot Value", value=f"${total_spot_value:,.2f}", delta=f"${total_spot_pl:,.2f} (Total P/L)")
-    chart_col, data_col = st.columns([0.4, 0.6])
-    with chart_col:
-        st.subheader("Spot Allocation")
-        pie_df = summary_df.reset_index().rename(columns={'coin': 'Coin'})
-        fig = px.pie(pie_df, values='Current Value (USD)', names='Coin', title='Spot Allocation')
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig, width='stretch')
-    with data_col:
-        st.subheader("Spot Holdings")
-        display_df = summary_df.reset_index().rename(columns={'coin': 'Coin'})
-        st.dataframe(display_df.style.format({
-            'Holdings': '{:,.8f}', 'Avg. Buy Price': '${:,.4f}', 'Live Price': '${:,.4f}',
-            'Current Value (USD)': '${:,.2f}', 'P/L (USD)': '${:,.2f}'
-        }), width='stretch')
-st.divider()
-
-st.subheader("My Futures Wallet & Positions")
-f_col1, f_col2, f_col3 = st.columns(3)
-f_col1.metric(label="Total Futures Equity", value=f"${total_futures_equity:,.2f}", delta=f"${total_futures_pnl:,.2f} (Total P/L)")
-f_col2.metric(label="Margin Terpakai", value=f"${total_futures_margin_used:,.2f}")
-f_col3.metric(label="Margin Tersedia (di Dompet)", value=f"${available_futures_balance:,.2f}")
-
-if futures_df.empty:
-    st.info("You have no open futures positions. Add one below.")
-else:
-    st.dataframe(futures_df.style.format({
-        'Size (USD)': '${:,.2f}', 'Margin': '${:,.2f}', 'Entry Price': '${:,.4f}',
-        'Live Price': '${:,.4f}', 'P/L (USD)': '${:,.2f}', 'P/L (%)': '{:,.2f}%',
-        'Liq. Price': '${:,.4f}'
-    }), width='stretch', hide_index=True)
-
-    st.subheader("Close a Position & Return to Wallet")
-    with st.form("close_form"):
-        pos_col_1, pos_col_2 = st.columns([1, 3])
-        with pos_col_1:
-            position_id_to_close = st.number_input("Position DB_ID to close:", min_value=1, step=1)
-        with pos_col_2:
-            close_button = st.form_submit_button("Close & Return to Futures Wallet")
-        
-        if close_button:
-            try:
-                pos_data_to_close = futures_df[futures_df['DB_ID'] == position_id_to_close].to_dict('records')
-                if not pos_data_to_close:
-                    st.error(f"Error: Tidak bisa menemukan posisi dengan DB_ID {position_id_to_close}.")
+        import plotly.express as px
+        st.metric(label="Total Spot Value", value=f"${state['total_spot_value']:,.2f}", delta=f"${state['total_spot_pl']:,.2f} (Total P/L)")
+        st.caption(f"Cost basis: {st.session_state.get('cost_basis_method', engine.COST_BASIS_METHODS[0])} (Realized P/L: ${summary_df['Realized P/L (USD)'].sum():,.2f})")
+        chart_col, data_col = st.columns([0.4, 0.6])
+        with chart_col:
+            st.subheader("Spot Allocation")
+            with metrics.span("render.chart.spot_allocation"):
+                pie_df = summary_df.reset_index().rename(columns={'coin': 'Coin'})
+                fig = px.pie(pie_df, values='Current Value (USD)', names='Coin', title='Spot Allocation')
+                fig.update_traces(textposition='inside', textinfo='percent+label')
+                st.plotly_chart(fig, width='stretch')
+        with data_col:
+            st.subheader("Spot Holdings")
+            display_df = summary_df.reset_index().rename(columns={'coin': 'Coin'})
+            st.dataframe(display_df.style.format({
+                'Holdings': '{:,.8f}', 'Avg. Buy Price': '${:,.4f}', 'Cost Basis (USD)': '${:,.2f}',
+                'Realized P/L (USD)': '${:,.2f}', 'Live Price': '${:,.4f}',
+                'Current Value (USD)': '${:,.2f}', 'Unrealized P/L (USD)': '${:,.2f}'
+            }), width='stretch')
+
+@st.fragment
+@metrics.timed("render.section.futures_positions")
+def render_futures_positions():
+    state = get_dashboard_state()
+    futures_df = state['futures_df']
+    st.subheader("My Futures Wallet & Positions")
+    f_col1, f_col2, f_col3 = st.columns(3)
+    f_col1.metric(label="Total Futures Equity", value=f"${state['total_futures_equity']:,.2f}", delta=f"${state['total_futures_pnl']:,.2f} (Total P/L)")
+    f_col2.metric(label="Margin Terpakai", value=f"${state['total_futures_margin_used']:,.2f}")
+    f_col3.metric(label="Margin Tersedia (di Dompet)", value=f"${state['available_futures_balance']:,.2f}")
+
+    if futures_df.empty:
+        st.info("You have no open futures positions. Add one below.")
+    else:
+        st.dataframe(futures_df.style.format({
+            'Size (USD)': '${:,.2f}', 'Margin': '${:,.2f}', 'Entry Price': '${:,.4f}',
+            'Live Price': '${:,.4f}', 'P/L (USD)': '${:,.2f}', 'P/L (%)': '{:,.2f}%',
+            'Liq. Price': '${:,.4f}'
+        }), width='stretch', hide_index=True)
+
+        st.subheader("Close a Position & Return to Wallet")
+        with st.form("close_form"):
+            pos_col_1, pos_col_2 = st.columns([1, 3])
+            with pos_col_1:
+                position_id_to_close = st.number_input("Position DB_ID to close:", min_value=1, step=1)
+            with pos_col_2:
+                close_button = st.form_submit_button("Close & Return to Futures Wallet")
+            
+            if close_button:
+                try:
+                    pos_data_to_close = futures_df[futures_df['DB_ID'] == position_id_to_close].to_dict('records')
+                    if not pos_data_to_close:
+                        st.error(f"Error: Tidak bisa menemukan posisi dengan DB_ID {position_id_to_close}.")
+                    else:
+                        coin = pos_data_to_close[0]['Coin']
+                        # Angka di tabel bisa berasal dari snapshot worker (sampai SNAPSHOT_MAX_AGE detik);
+                        # penutupan selalu diselesaikan dengan harga live
+                        live_prices = get_live_price_cache().get_prices([coin])
+                        if coin != 'tether' and not live_prices.get(coin):
+                            raise ValueError(f"harga live untuk '{coin}' tidak tersedia")
+                        # Hapus dulu: hanya sesi yang benar-benar menghapus baris yang mengkredit dompet,
+                        # jadi submit ganda atau dua sesi yang menutup posisi yang sama tidak kredit dua kali
+                        deleted = db_execute('futures_positions.delete', client.table('futures_positions').delete().eq('id', int(position_id_to_close)).eq('account_id', current_account())).data
+                        get_futures_mirror().remove(int(position_id_to_close))
+                        if not deleted:
+                            st.error(f"Posisi {position_id_to_close} sudah ditutup (mungkin dari sesi lain); dompet tidak diubah.")
+                            refresh_futures_positions()
+                        else:
+                            settled = engine.calculate_futures_metrics(deleted, live_prices).iloc[0]
+                            total_cash_back = max(float(settled['Margin'] + settled['P/L (USD)']), 0.0)
+                            new_balance = adjust_futures_wallet_balance(total_cash_back)
+                            if new_balance is None:
+                                # Kredit gagal: kembalikan posisinya agar margin dan P/L tidak hilang
+                                restored = db_execute('futures_positions.insert', client.table('futures_positions').insert(deleted[0])).data
+                                get_futures_mirror().apply_inserted(restored)
+                                refresh_futures_positions()
+                            else:
+                                st.success(f"Posisi {position_id_to_close} ditutup. Total ${total_cash_back:,.2f} dikembalikan ke Dompet Futures.")
+                                refresh_futures_positions()
+                                st.session_state.futures_balance = new_balance
+                                st.rerun()
+                except Exception as e:
+                    st.error(f"Gagal menutup posisi: {e}"); st.exception(e)
+
+@st.fragment
+@metrics.timed("render.section.futures_stress_test")
+def render_futures_stress_test():
+    state = get_dashboard_state()
+    futures_df = state['futures_df']
+    if futures_df.empty:
+        return
+    import plotly.express as px
+    with st.expander("Futures Stress Test & Liquidation Map"):
+        st_col1, st_col2 = st.columns(2)
+        with st_col1:
+            max_shock = st.slider("Max price shock (%)", min_value=5, max_value=90, value=int(engine.STRESS_MAX_SHOCK * 100), step=5)
+        with st_col2:
+            step = st.selectbox("Step (%)", [0.5, 1.0, 2.5], index=0)
+        # Dihitung ulang setiap kali harga live berubah (fragment dijalankan ulang)
+        result = engine.futures_stress_test(
+            st.session_state.futures_positions, futures_df['Live Price'].to_numpy(),
+            state['available_futures_balance'], engine.stress_shocks(max_shock / 100, step / 100),
+        )
+        scenarios = result['scenarios']
+        with metrics.span("render.chart.stress_equity"):
+            fig_eq = px.line(scenarios.reset_index(), x='Shock (%)', y='Equity', hover_data=['P/L (USD)', 'Liquidated', 'Margin Lost'], title='Futures Equity vs. Price Shock (all coins)')
+            fig_eq.update_layout(yaxis_title='Equity (USD)', yaxis_tickprefix='$', yaxis_tickformat=',.2f', xaxis_ticksuffix='%')
+            st.plotly_chart(fig_eq, width='stretch')
+        liquidation_map = result['liquidation_map']
+        liquidation_map = liquidation_map.loc[liquidation_map.sum(axis=1) > 0]
+        if liquidation_map.empty:
+            st.info(f"Tidak ada posisi yang terlikuidasi dalam rentang ±{max_shock}%.")
+        else:
+            with metrics.span("render.chart.liquidation_heatmap"):
+                fig_heat = px.imshow(liquidation_map, aspect='auto', color_continuous_scale='Reds',
+                                     labels={'x': 'Shock (%)', 'y': 'Coin', 'color': 'Margin (USD)'},
+                                     title='Margin Liquidated by Price Shock')
+                st.plotly_chart(fig_heat, width='stretch')
+        nearest = result['positions'].dropna(subset=['Liq. Move (%)'])
+        nearest = nearest.reindex(nearest['Liq. Move (%)'].abs().sort_values().index).head(10)
+        st.write("**Posisi terdekat ke likuidasi**")
+        st.dataframe(nearest.style.format({
+            'Margin': '${:,.2f}', 'Live Price': '${:,.4f}', 'Liq. Price': '${:,.4f}', 'Liq. Move (%)': '{:+,.2f}%'
+        }), width='stretch', hide_index=True)
+
+@st.fragment
+@metrics.timed("render.section.spot_history")
+def render_spot_history():
+    st.subheader("Spot Portfolio Historical Performance")
+    if not st.session_state.trades:
+        st.info("Add spot trades to see historical performance.")
+    else:
+        import plotly.express as px
+        res_col, view_col = st.columns(2)
+        with res_col:
+            resolution = st.selectbox("Resolution", ["Daily", "Hourly", "5-Minute (24h)"])
+        with view_col:
+            view = st.selectbox("View as", ["As fetched"] + list(engine.RESAMPLE_RULES))
+        if st.button("Generate Spot Performance Chart"):
+            with st.spinner("Crunching spot trade history..."):
+                if resolution == "Daily":
+                    history_df = engine.calculate_portfolio_history(st.session_state.trades, cg, account_id=current_account())
                 else:
-                    pos_data = pos_data_to_close[0]
-                    final_pnl = pos_data['P/L (USD)']; original_margin = pos_data['Margin']
-                    total_cash_back = original_margin + final_pnl
-                    if total_cash_back < 0: total_cash_back = 0
-                    current_balance = load_futures_wallet_balance()
-                    new_balance = current_balance + total_cash_back
-                    update_futures_wallet_balance(new_balance)
-                    client.table('futures_positions').delete().eq('id', int(position_id_to_close)).execute()
-                    st.success(f"Posisi {position_id_to_close} ditutup. Total ${total_cash_back:,.2f} dikembalikan ke Dompet Futures.")
-                    st.session_state.futures_positions = load_futures_positions()
-                    st.session_state.futures_balance = load_futures_wallet_balance()
-                    st.rerun() 
-            except Exception as e:
-                st.error(f"Gagal menutup posisi: {e}"); st.exception(e)
-st.divider()
-
-st.subheader("Spot Portfolio Historical Performance")
-if not st.session_state.trades:
-    st.info("Add spot trades to see historical performance.")
-else:
-    if st.button("Generate Spot Performance Chart"):
-        with st.spinner("Crunching spot trade history..."):
-            history_df = engine.calculate_portfolio_history(st.session_state.trades, cg)
+                    intraday = '1h' if resolution == "Hourly" else '5min'
+                    history_df = engine.calculate_intraday_portfolio_history(st.session_state.trades, cg, intraday)
+                st.session_state.history_chart = (resolution, history_df)
+        # Hasil disimpan di sesi: ganti "View as" hanya me-resample, tanpa menghitung ulang
+        if st.session_state.get('history_chart'):
+            generated_resolution, history_df = st.session_state.history_chart
             if history_df.empty: st.warning("Could not generate history.")
             else:
-                fig = px.line(history_df, y='Total Value', title='Spot Portfolio Value Over Time')
-                fig.update_layout(xaxis_title='Date', yaxis_title='Portfolio Value (USD)', yaxis_tickprefix = '$', yaxis_tickformat = ',.2f')
-                st.plotly_chart(fig, width='stretch')
-st.divider()
-
-form_col1, form_col2 = st.columns(2)
-with form_col1:
+                with metrics.span("render.chart.spot_history"):
+                    chart_df = engine.resample_history(history_df, view)
+                    # Hasil resample juga punya 'Low' (titik terendah per periode) agar drawdown intraday tetap terlihat
+                    columns = [c for c in ('Total Value', 'Low') if c in chart_df]
+                    fig = px.line(engine.downsample_lttb(chart_df, columns), y=columns, title=f'Spot Portfolio Value Over Time ({generated_resolution})')
+                    fig.update_layout(xaxis_title='Date', yaxis_title='Portfolio Value (USD)', yaxis_tickprefix = '$', yaxis_tickformat = ',.2f', legend_title=None)
+                    st.plotly_chart(fig, width='stretch')
+
+@st.fragment
+@metrics.timed("render.section.spot_analytics")
+def render_spot_analytics():
+    st.subheader("Spot Risk & Performance Analytics")
+    if not st.session_state.trades:
+        st.info("Add spot trades to see risk analytics.")
+        return
+    if st.button("Compute Risk Analytics"):
+        with st.spinner("Computing risk analytics..."):
+            st.session_state.analytics_report = get_portfolio_analytics(st.session_state.trades)
+    report = st.session_state.get('analytics_report')
+    if report is None:
+        return
+    if not report:
+        st.warning("Belum cukup riwayat harian untuk analitik."); return
+    import analytics
+    import plotly.express as px
+    a_col1, a_col2, a_col3, a_col4, a_col5 = st.columns(5)
+    a_col1.metric("Total Return", f"{report['total_return']:.2%}")
+    a_col2.metric("Volatility (ann.)", f"{report['volatility']:.2%}")
+    a_col3.metric("Sharpe", f"{report['sharpe']:.2f}")
+    a_col4.metric("Sortino", f"{report['sortino']:.2f}")
+    a_col5.metric("Max Drawdown", f"{report['max_drawdown']:.2%}", delta=f"{report['max_drawdown_days']} hari di bawah puncak", delta_color="off")
+    series = report['series']
+    chart_col, coin_col = st.columns([0.6, 0.4])
+    with chart_col:
+        with metrics.span("render.chart.analytics_risk"):
+            risk_df = engine.downsample_lttb(series[['Drawdown', 'Rolling Volatility']], ['Drawdown', 'Rolling Volatility'])
+            fig = px.line(risk_df, y=['Drawdown', 'Rolling Volatility'], title=f'Drawdown & {analytics.DEFAULT_WINDOW}-Day Rolling Volatility')
+            fig.update_layout(xaxis_title='Date', yaxis_title=None, yaxis_tickformat='.0%', legend_title=None)
+            st.plotly_chart(fig, width='stretch')
+    with coin_col:
+        st.dataframe(report['contribution'].style.format({'Return Contribution': '{:.2%}', 'P/L (USD)': '${:,.2f}'}), width='stretch')
+    if len(report['correlation']) > 1:
+        with metrics.span("render.chart.analytics_correlation"):
+            fig_corr = px.imshow(report['correlation'], zmin=-1, zmax=1, color_continuous_scale='RdBu', text_auto='.2f',
+                                 title=f'{analytics.DEFAULT_WINDOW}-Day Return Correlation')
+            st.plotly_chart(fig_corr, width='stretch')
+
+@st.fragment
+@metrics.timed("render.section.spot_trade_form")
+def render_spot_trade_form():
     st.subheader("Log a New Spot Trade")
     with st.form("trade_form", clear_on_submit=True):
         f1_col1, f1_col2, f1_col3 = st.columns(3)
@@ -336,14 +662,50 @@ with form_col1:
             if not coin_id: st.error("Please enter a Coin ID.")
             else:
                 total_cost = amount * price_per_coin
-                new_trade = {"date": str(trade_date), "coin": coin_id, "type": trade_type, "amount": amount, "price_per_coin": price_per_coin, "total_cost_usd": total_cost}
+                new_trade = {"account_id": current_account(), "date": str(trade_date), "coin": coin_id, "type": trade_type, "amount": amount, "price_per_coin": price_per_coin, "total_cost_usd": total_cost}
                 try:
-                    client.table('spot_trades').insert(new_trade).execute()
-                    st.success("Spot trade berhasil disimpan!"); st.session_state.trades = load_trades(); st.rerun()
+                    response = db_execute('spot_trades.insert', client.table('spot_trades').insert(new_trade))
+                    get_trades_mirror().apply_inserted(response.data)
+                    st.success("Spot trade berhasil disimpan!"); refresh_trades(); st.rerun()
                 except Exception as e:
                     st.error(f"Gagal menyimpan trade: {e}")
 
-with form_col2:
+@st.fragment
+@metrics.timed("render.section.trade_import")
+def render_trade_import():
+    st.subheader("Bulk Import Spot Trades")
+    st.caption("CSV, JSON atau JSON Lines dari export exchange. Kolom dikenali otomatis (date/time, coin/asset/pair, side, amount/executed, price, total). Trade yang sudah ada dilewati.")
+    uploaded = st.file_uploader("Trade export file", type=['csv', 'json', 'jsonl', 'ndjson'])
+    symbol_text = st.text_input("Symbol mapping (opsional)", placeholder="ARB=arbitrum, OP=optimism",
+                                help="Simbol di luar daftar bawaan harus dipetakan ke id CoinGecko; baris dengan simbol yang tidak dikenal ditolak.")
+    if uploaded is not None and st.button("Import Trades"):
+        from trade_import import import_trades, parse_symbol_map
+        progress_bar = st.progress(0.0, text="Importing...")
+        def show_progress(stats):
+            done = min(1.0, uploaded.tell() / uploaded.size) if uploaded.size else 1.0
+            progress_bar.progress(done, text=f"{stats['rows']:,} baris dibaca, {stats['inserted']:,} disimpan...")
+        try:
+            symbol_map = parse_symbol_map(symbol_text)
+            stats, rejected_df = import_trades(client, uploaded, uploaded.name, st.session_state.trades, account_id=current_account(),
+                                               symbol_map=symbol_map, progress=show_progress)
+        except Exception as e:
+            st.error(f"Gagal meng-import trade: {e}"); return
+        progress_bar.empty()
+        st.session_state.import_result = (stats, rejected_df)
+        # Satu sync bertahap + satu rerun untuk seluruh import
+        if stats['inserted']:
+            refresh_trades(); st.rerun()
+    if st.session_state.get('import_result'):
+        stats, rejected_df = st.session_state.import_result
+        st.success(f"{stats['inserted']:,} trade di-import dari {stats['rows']:,} baris ({stats['duplicates']:,} duplikat dilewati, {stats['rejected']:,} ditolak).")
+        if not rejected_df.empty:
+            st.write("Baris yang ditolak:")
+            st.dataframe(rejected_df, width='stretch')
+
+@st.fragment
+@metrics.timed("render.section.futures_form")
+def render_futures_form():
+    available_futures_balance = st.session_state.futures_balance
     st.subheader("Log a New Futures Position")
     st.info(f"Dompet Tersedia: ${available_futures_balance:,.2f}")
     with st.form("futures_form", clear_on_submit=True):
@@ -364,95 +726,222 @@ with form_col2:
                 if available_futures_balance < margin_needed:
                     st.error(f"Margin tidak cukup. Butuh: ${margin_needed:,.2f}, Tersedia: ${available_futures_balance:,.2f}")
                 else:
-                    new_position = {"coin_id": fut_coin_id, "direction": fut_direction, "entry_price": fut_entry_price, "margin": margin_needed, "leverage": int(fut_leverage)}
+                    new_position = {"account_id": current_account(), "coin_id": fut_coin_id, "direction": fut_direction, "entry_price": fut_entry_price, "margin": margin_needed, "leverage": int(fut_leverage)}
                     try:
-                        new_balance = available_futures_balance - margin_needed
-                        update_futures_wallet_balance(new_balance)
-                        client.table('futures_positions').insert(new_position).execute()
-                        st.success(f"Posisi dibuka! ${margin_needed:,.2f} margin telah dipindahkan dari dompet.")
-                        st.session_state.futures_positions = load_futures_positions()
-                        st.session_state.futures_balance = new_balance
-                        st.rerun()
+                        new_balance = adjust_futures_wallet_balance(-margin_needed)
+                        if new_balance is not None:
+                            response = db_execute('futures_positions.insert', client.table('futures_positions').insert(new_position))
+                            get_futures_mirror().apply_inserted(response.data)
+                            st.success(f"Posisi dibuka! ${margin_needed:,.2f} margin telah dipindahkan dari dompet.")
+                            refresh_futures_positions()
+                            st.session_state.futures_balance = new_balance
+                            st.rerun()
                     except Exception as e:
                         st.error(f"Gagal membuka posisi: {e}"); st.exception(e)
 
-st.divider()
-st.subheader("Futures Wallet Management")
-st.info(f"Saldo Dompet Tersedia Saat Ini: ${available_futures_balance:,.2f}")
-with st.form("wallet_form"):
-    wm_col1, wm_col2, wm_col3 = st.columns(3)
-    with wm_col1:
-        transfer_amount = st.number_input("Amount (USD)", min_value=0.01)
-    with wm_col2:
-        deposit_button = st.form_submit_button("Deposit to Futures Wallet")
-    with wm_col3:
-        withdraw_button = st.form_submit_button("Withdraw from Futures Wallet")
-    if deposit_button:
-        new_balance = available_futures_balance + transfer_amount
-        update_futures_wallet_balance(new_balance)
-        st.success(f"Deposit ${transfer_amount} berhasil. Saldo baru: ${new_balance:,.2f}")
-        st.session_state.futures_balance = new_balance
-        st.rerun()
-    if withdraw_button:
-        if available_futures_balance < transfer_amount:
-            st.error("Dana tidak cukup untuk ditarik.")
-        else:
-            new_balance = available_futures_balance - transfer_amount
-            update_futures_wallet_balance(new_balance)
-            st.success(f"Withdraw ${transfer_amount} berhasil. Saldo baru: ${new_balance:,.2f}")
-            st.session_state.futures_balance = new_balance
-            st.rerun()
-st.divider()
-
-st.subheader("My Full Spot Trade Log (From Database)")
-if not st.session_state.trades:
-    st.info("Log trade spot Anda kosong.")
-else:
-    log_df = pd.DataFrame(st.session_state.trades).rename(columns={'id': 'DB_ID'})
-    st.dataframe(log_df, width='stretch')
-    
-    st.subheader("Delete a Spot Trade")
-    with st.form("delete_spot_form"):
-        del_col_1, del_col_2 = st.columns([1, 3])
-        with del_col_1:
-            trade_id_to_delete = st.number_input("Trade DB_ID to delete:", min_value=1, step=1)
-        with del_col_2:
-            delete_button = st.form_submit_button("Delete Spot Trade")
-        if delete_button:
-            try:
-                client.table('spot_trades').delete().eq('id', int(trade_id_to_delete)).execute()
-                st.success(f"Trade ID {trade_id_to_delete} dihapus."); st.session_state.trades = load_trades(); st.rerun()
-            except Exception as e:
-                st.error(f"Gagal menghapus trade: {e}")
-
-st.divider()
-st.subheader("--- 📛 ZONA BAHAYA 📛 ---")
-st.warning("Tindakan di bawah ini permanen dan tidak bisa dibatalkan. Data Anda akan hilang selamanya.")
-col_danger_1, col_danger_2 = st.columns(2)
-with col_danger_1:
-    with st.form("clear_spot_form"):
-        st.write("Tekan tombol ini untuk menghapus **SEMUA** riwayat trade Spot Anda secara permanen.")
-        clear_spot_button = st.form_submit_button("🔥 HAPUS SEMUA SPOT TRADES 🔥", type="primary")
-        if clear_spot_button:
-            try:
-                client.table('spot_trades').delete().gt('id', 0).execute() 
-                st.session_state.trades = []
-                st.success("SEMUA trade spot telah dihapus dari database.")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Gagal menghapus spot: {e}")
-
-with col_danger_2:
-    with st.form("clear_futures_form"):
-        st.write("Tekan ini untuk menghapus **SEMUA** posisi Futures DAN mengosongkan Dompet Futures Anda ke $0.")
-        clear_futures_button = st.form_submit_button("🔥 HAPUS SEMUA FUTURES 🔥", type="primary")
-        if clear_futures_button:
-            try:
-                client.table('futures_positions').delete().gt('id', 0).execute()
-                update_futures_wallet_balance(0.0)
-                st.session_state.futures_positions = []
-                st.session_state.futures_balance = 0.0
-                st.success("SEMUA posisi futures DAN saldo dompet telah dihapus.")
+@st.fragment
+@metrics.timed("render.section.wallet_management")
+def render_wallet_management():
+    available_futures_balance = st.session_state.futures_balance
+    st.subheader("Futures Wallet Management")
+    st.info(f"Saldo Dompet Tersedia Saat Ini: ${available_futures_balance:,.2f}")
+    with st.form("wallet_form"):
+        wm_col1, wm_col2, wm_col3 = st.columns(3)
+        with wm_col1:
+            transfer_amount = st.number_input("Amount (USD)", min_value=0.01)
+        with wm_col2:
+            deposit_button = st.form_submit_button("Deposit to Futures Wallet")
+        with wm_col3:
+            withdraw_button = st.form_submit_button("Withdraw from Futures Wallet")
+        if deposit_button:
+            new_balance = adjust_futures_wallet_balance(transfer_amount)
+            if new_balance is not None:
+                st.success(f"Deposit ${transfer_amount} berhasil. Saldo baru: ${new_balance:,.2f}")
+                st.session_state.futures_balance = new_balance
                 st.rerun()
-            except Exception as e:
-                st.error(f"Gagal menghapus futures: {e}")
+        if withdraw_button:
+            if available_futures_balance < transfer_amount:
+                st.error("Dana tidak cukup untuk ditarik.")
+            else:
+                new_balance = adjust_futures_wallet_balance(-transfer_amount)
+                if new_balance is not None:
+                    st.success(f"Withdraw ${transfer_amount} berhasil. Saldo baru: ${new_balance:,.2f}")
+                    st.session_state.futures_balance = new_balance
+                    st.rerun()
+
+@st.fragment
+@metrics.timed("render.section.trade_log")
+def render_trade_log():
+    st.subheader("My Full Spot Trade Log (From Database)")
+    if not st.session_state.trades:
+        st.info("Log trade spot Anda kosong.")
+    else:
+        log_df = pd.DataFrame(st.session_state.trades).rename(columns={'id': 'DB_ID'})
+        st.dataframe(log_df, width='stretch')
+        
+        st.subheader("Delete a Spot Trade")
+        with st.form("delete_spot_form"):
+            del_col_1, del_col_2 = st.columns([1, 3])
+            with del_col_1:
+                trade_id_to_delete = st.number_input("Trade DB_ID to delete:", min_value=1, step=1)
+            with del_col_2:
+                delete_button = st.form_submit_button("Delete Spot Trade")
+            if delete_button:
+                try:
+                    db_execute('spot_trades.delete', client.table('spot_trades').delete().eq('id', int(trade_id_to_delete)).eq('account_id', current_account()))
+                    get_trades_mirror().remove(int(trade_id_to_delete))
+                    st.success(f"Trade ID {trade_id_to_delete} dihapus."); refresh_trades(); st.rerun()
+                except Exception as e:
+                    st.error(f"Gagal menghapus trade: {e}")
+
+@st.fragment
+@metrics.timed("render.section.danger_zone")
+def render_danger_zone():
+    st.subheader("--- 📛 ZONA BAHAYA 📛 ---")
+    st.warning("Tindakan di bawah ini permanen dan tidak bisa dibatalkan. Data Anda akan hilang selamanya.")
+    col_danger_1, col_danger_2 = st.columns(2)
+    with col_danger_1:
+        with st.form("clear_spot_form"):
+            st.write("Tekan tombol ini untuk menghapus **SEMUA** riwayat trade Spot di akun ini secara permanen.")
+            clear_spot_button = st.form_submit_button("🔥 HAPUS SEMUA SPOT TRADES 🔥", type="primary")
+            if clear_spot_button:
+                try:
+                    db_execute('spot_trades.delete_all', client.table('spot_trades').delete().eq('account_id', current_account()))
+                    get_trades_mirror().clear()
+                    refresh_trades()
+                    st.success("SEMUA trade spot telah dihapus dari database.")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Gagal menghapus spot: {e}")
+
+    with col_danger_2:
+        with st.form("clear_futures_form"):
+            st.write("Tekan ini untuk menghapus **SEMUA** posisi Futures di akun ini DAN mengosongkan Dompet Futures-nya ke $0.")
+            clear_futures_button = st.form_submit_button("🔥 HAPUS SEMUA FUTURES 🔥", type="primary")
+            if clear_futures_button:
+                try:
+                    db_execute('futures_positions.delete_all', client.table('futures_positions').delete().eq('account_id', current_account()))
+                    get_futures_mirror().clear()
+                    refresh_futures_positions()
+                    # Posisi sudah terhapus; saldo hanya dianggap nol jika upsert dompet berhasil
+                    new_balance = set_futures_wallet_balance(0.0)
+                    if new_balance is not None:
+                        st.session_state.futures_balance = new_balance
+                        st.success("SEMUA posisi futures DAN saldo dompet telah dihapus.")
+                        st.rerun()
+                    else:
+                        st.warning("Posisi futures sudah dihapus, tetapi saldo dompet gagal dikosongkan. Coba lagi.")
+                except Exception as e:
+                    st.error(f"Gagal menghapus futures: {e}")
+
+# --- Tampilan gabungan semua akun (opsional, dari sidebar) ---
+@st.fragment
+@metrics.timed("render.section.consolidated")
+def render_consolidated_view():
+    st.subheader("All Accounts (Consolidated)")
+    account_names = {account['id']: account['name'] for account in load_account_list()}
+    method = st.session_state.get('cost_basis_method', engine.COST_BASIS_METHODS[0])
+    book = get_account_book()
+    try:
+        data = book.sync_all(account_names)
+    except Exception as e:
+        st.error(f"Error membaca data akun: {e}"); return
+    summaries = {
+        account_id: book.spot_summary(account_id, method, trades, version)
+        for account_id, (trades, version, _) in data.items()
+    }
+    positions = [pos for _, _, account_positions in data.values() for pos in account_positions]
+    coins = set()
+    for account_id, summary_df in summaries.items():
+        coins.update(engine.dashboard_coins(summary_df, data[account_id][2]))
+    live_prices = {}
+    try:
+        # Satu permintaan untuk gabungan koin semua akun, lewat cache harga bersama
+        with metrics.span("live_prices.get"):
+            live_prices = get_live_price_cache().get_prices(sorted(coins))
+    except Exception as e:
+        st.error(f"Error fetching live prices: {e}")
+    balances = {account_id: balance for account_id, balance in load_all_wallet_balances().items() if account_id in account_names}
+    with metrics.span("consolidated.calculate"):
+        result = engine.calculate_consolidated(summaries, positions, balances, live_prices)
+
+    c_col1, c_col2, c_col3 = st.columns(3)
+    c_col1.metric(label="Total Equity (All Accounts)", value=f"${result['grand_total']:,.2f}", delta=f"${result['total_pl']:,.2f} (Total P/L)")
+    c_col2.metric(label="Total Spot Value", value=f"${result['total_spot_value']:,.2f}")
+    c_col3.metric(label="Total Futures Equity", value=f"${result['total_futures_equity']:,.2f}")
+    accounts_df = result['accounts_df']
+    accounts_df.insert(0, 'Account', accounts_df.index.map(lambda account_id: account_names.get(account_id, f"Account {account_id}")))
+    usd_format = {column: '${:,.2f}' for column in accounts_df.columns if column.endswith('(USD)')}
+    st.dataframe(accounts_df.style.format(usd_format), width='stretch')
+    if len(accounts_df) > 1:
+        import plotly.express as px
+        with metrics.span("render.chart.consolidated_accounts"):
+            fig = px.bar(accounts_df, x='Account', y=['Spot Value (USD)', 'Futures Equity (USD)'], title='Equity per Account')
+            fig.update_layout(xaxis_title=None, yaxis_title='USD', yaxis_tickprefix='$', yaxis_tickformat=',.2f', legend_title=None)
+            st.plotly_chart(fig, width='stretch')
+    st.write("**Exposure per koin (semua akun)**")
+    st.dataframe(result['coins_df'].style.format({
+        'Spot Holdings': '{:,.8f}', 'Spot Value (USD)': '${:,.2f}', 'Net Futures (USD)': '${:,.2f}',
+        'Futures P/L (USD)': '${:,.2f}', 'Net Exposure (USD)': '${:,.2f}',
+    }), width='stretch')
+
+# --- Panel Performa (opsional, dari sidebar) ---
+@st.fragment
+def render_performance_panel():
+    with st.expander("Performance", expanded=True):
+        data = metrics.snapshot()
+        st.caption(f"Angka untuk seluruh proses server (semua sesi), sejak {data['uptime_seconds']:,.0f} detik lalu.")
+        if data['spans']:
+            spans_df = pd.DataFrame.from_dict(data['spans'], orient='index').sort_values('total_seconds', ascending=False)
+            timing_cols = ['total_seconds', 'mean_seconds', 'max_seconds', 'last_seconds']
+            spans_df[timing_cols] *= 1000
+            spans_df = spans_df.rename(columns=lambda c: c.replace('_seconds', ' (ms)'))
+            st.dataframe(spans_df.style.format('{:,.2f}', subset=[c.replace('_seconds', ' (ms)') for c in timing_cols]), width='stretch')
+        perf_col1, perf_col2 = st.columns(2)
+        with perf_col1:
+            st.write("**Cache hit/miss**")
+            if data['caches']:
+                st.dataframe(pd.DataFrame.from_dict(data['caches'], orient='index').style.format({'hit_rate': '{:.0%}'}), width='stretch')
+        with perf_col2:
+            st.write("**Counter**")
+            if data['counters']:
+                st.dataframe(pd.Series(data['counters'], name='value').sort_index(), width='stretch')
+        exp_col1, exp_col2, exp_col3, exp_col4 = st.columns(4)
+        exp_col1.download_button("Export JSON", metrics.to_json(), file_name="metrics.json", mime="application/json")
+        exp_col2.download_button("Export Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if exp_col3.button("Refresh Metrics"):
+            st.rerun(scope="fragment")
+        if exp_col4.button("Reset Metrics"):
+            metrics.reset(); st.rerun(scope="fragment")
+
+# 5. --- Sidebar, lalu isi slot kerangka secara bertahap ---
+account_names = {account['id']: account['name'] for account in load_account_list()}
+st.sidebar.selectbox("Account", list(account_names), format_func=lambda account_id: account_names.get(account_id, f"Account {account_id}"), key='account_id', on_change=switch_account)
+st.sidebar.selectbox("Cost Basis Method", engine.COST_BASIS_METHODS, key='cost_basis_method')
+st.sidebar.toggle("Show All Accounts", key='show_consolidated')
+st.sidebar.toggle("Show Performance Panel", key='show_performance')
+
+# Bagian yang datanya lokal (mirror, snapshot, cache) lebih dulu; pasar global
+# (tiga request CoinGecko saat cache dingin) dan panel performa paling akhir.
+SECTION_RENDERERS = {
+    'total_value': render_total_value,
+    'spot_portfolio': render_spot_portfolio,
+    'futures_positions': render_futures_positions,
+    'futures_stress_test': render_futures_stress_test,
+    'spot_trade_form': render_spot_trade_form,
+    'futures_form': render_futures_form,
+    'wallet_management': render_wallet_management,
+    'trade_log': render_trade_log,
+    'trade_import': render_trade_import,
+    'danger_zone': render_danger_zone,
+    'spot_history': render_spot_history,
+    'spot_analytics': render_spot_analytics,
+    'consolidated': render_consolidated_view,
+    'global_market': render_global_market,
+    'performance': render_performance_panel,
+}
+for name, render in SECTION_RENDERERS.items():
+    if name in slots:
+        with slots[name].container():
+            render()
+metrics.record("render.page", time.perf_counter() - _script_started)
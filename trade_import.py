@@ -0,0 +1,219 @@
+"""Import massal trade spot dari export exchange (CSV, JSON array atau JSON Lines).
+
+File dibaca per chunk, dinormalisasi dan divalidasi secara vektor, lalu
+duplikat dibuang dengan sidik jari trade yang stabil sebelum dimasukkan ke
+Supabase dalam batch besar. Import ulang file yang sama tidak menambah baris.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import metrics
+from table_sync import DEFAULT_ACCOUNT_ID, trade_fingerprints
+
+IMPORT_CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", "50000"))
+# Satu request insert per batch; payload ~2000 baris masih jauh di bawah batas body PostgREST
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", "2000"))
+TRADE_COLUMNS = ['date', 'coin', 'type', 'amount', 'price_per_coin', 'total_cost_usd']
+MAX_REJECTED_ROWS = 1000
+
+# Nama kolom umum di export exchange (sudah dinormalisasi: huruf kecil, selain a-z0-9 jadi '_')
+COLUMN_ALIASES = {
+    'date': ('date', 'date_utc', 'trade_date', 'time', 'time_utc', 'timestamp', 'datetime', 'created_at'),
+    'coin': ('coin', 'coin_id', 'asset', 'base_asset', 'base_currency', 'currency', 'symbol', 'pair', 'market'),
+    'type': ('type', 'side', 'trade_type', 'order_side'),
+    # Jika ada kolom jumlah koin yang eksplisit (mis. 'Executed' di Binance), 'amount' berarti total quote
+    'amount': ('quantity', 'qty', 'executed', 'filled', 'size', 'amount'),
+    'price_per_coin': ('price_per_coin', 'price', 'price_usd', 'avg_price', 'execution_price', 'rate'),
+    'total_cost_usd': ('total_cost_usd', 'total', 'total_usd', 'cost', 'quote_amount', 'value', 'amount'),
+}
+# Pasangan seperti 'BTCUSDT' / 'ETH-USD' dipotong menjadi aset dasarnya
+QUOTE_SUFFIX = r'(?<=.)[-/_]?(usdt|usdc|busd|usd)$'
+# Angka di awal teks (setelah simbol mata uang), tanpa satuan di belakangnya: '1.0ETH' -> '1.0'
+LEADING_NUMBER = r'^[^\d.+-]*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)'
+TRADE_TYPES = {'buy': 'Buy', 'b': 'Buy', 'sell': 'Sell', 's': 'Sell'}
+# Export exchange memakai simbol, aplikasi memakai id CoinGecko
+SYMBOL_TO_COIN_ID = {
+    'btc': 'bitcoin', 'eth': 'ethereum', 'usdt': 'tether', 'usdc': 'usd-coin', 'bnb': 'binancecoin',
+    'sol': 'solana', 'xrp': 'ripple', 'ada': 'cardano', 'doge': 'dogecoin', 'dot': 'polkadot',
+    'trx': 'tron', 'ltc': 'litecoin', 'avax': 'avalanche-2', 'link': 'chainlink', 'matic': 'matic-network',
+}
+UNKNOWN_SYMBOL_REASON = "unknown coin symbol (add it to the symbol mapping)"
+
+
+def _column_key(name):
+    return re.sub(r'[^a-z0-9]+', '_', str(name).strip().lower()).strip('_')
+
+
+def _to_number(series):
+    """Angka dari kolom apa pun; teks seperti '1,250.5', '$30' atau '1.0ETH' dibersihkan dulu."""
+    numbers = pd.to_numeric(series, errors='coerce').astype(float)
+    unparsed = numbers.isna() & series.notna()
+    if unparsed.any():
+        cleaned = series[unparsed].astype(str).str.replace(',', '', regex=False)
+        numbers[unparsed] = pd.to_numeric(cleaned.str.extract(LEADING_NUMBER, expand=False), errors='coerce')
+    return numbers
+
+
+def parse_symbol_map(text):
+    """Mapping simbol -> id CoinGecko dari teks 'ARB=arbitrum, OP=optimism' (pemisah koma atau baris baru)."""
+    mapping = {}
+    for item in re.split(r'[,\n]', text or ''):
+        if not item.strip():
+            continue
+        symbol, sep, coin_id = item.partition('=')
+        if not sep or not symbol.strip() or not coin_id.strip():
+            raise ValueError(f"Format mapping tidak valid: '{item.strip()}' (gunakan SIMBOL=coin-id)")
+        mapping[symbol.strip().lower()] = coin_id.strip().lower()
+    return mapping
+
+
+def _to_coin_id(series, symbol_map, known_ids):
+    """Id CoinGecko per baris; simbol yang tidak dikenal menjadi <NA>."""
+    raw = series.astype('string').str.strip().str.lower()
+    # Id yang sudah dikenal (mis. 'true-usd') tidak dipotong akhiran quote-nya
+    base = raw.where(raw.isin(known_ids), raw.str.replace(QUOTE_SUFFIX, '', regex=True))
+    return base.map(symbol_map).astype('string').fillna(base.where(base.isin(known_ids)))
+
+
+def _to_date(series):
+    numeric = pd.to_numeric(series, errors='coerce')
+    if numeric.notna().all() and len(series):
+        series = numeric
+    if pd.api.types.is_numeric_dtype(series):
+        # Epoch: milidetik jika sangat besar, selain itu detik
+        unit = 'ms' if series.abs().max() > 1e11 else 's'
+        return pd.to_datetime(series, unit=unit, errors='coerce')
+    return pd.to_datetime(series, errors='coerce', format='mixed', utc=True).dt.tz_localize(None)
+
+
+def read_trade_chunks(source, file_name, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Iterator DataFrame mentah per chunk dari file CSV, JSON Lines atau JSON array."""
+    name = file_name.lower()
+    if name.endswith('.csv'):
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype=str, skipinitialspace=True)
+        return
+    if name.endswith(('.jsonl', '.ndjson')):
+        yield from pd.read_json(source, lines=True, chunksize=chunk_rows, dtype=False)
+        return
+    # .json: array harus dibaca utuh; objek per baris tetap di-stream
+    head = source.read(1)
+    while head and head.isspace():
+        head = source.read(1)
+    source.seek(0)
+    if head in ('[', b'['):
+        data = pd.read_json(source, dtype=False)
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows]
+    else:
+        yield from pd.read_json(source, lines=True, chunksize=chunk_rows, dtype=False)
+
+
+def normalize_trades(raw_df, symbol_map=None, known_ids=()):
+    """Memetakan kolom export ke skema `spot_trades` dan memvalidasi semua baris sekaligus.
+
+    Simbol dipetakan lewat SYMBOL_TO_COIN_ID ditambah `symbol_map`; nilai yang
+    sudah berupa id yang dikenal (target mapping atau `known_ids`) diterima apa
+    adanya, selain itu baris ditolak agar tidak ada koin palsu yang tersimpan.
+    Mengembalikan (valid_df, rejected_df); rejected_df berisi baris asli plus kolom 'reason'.
+    """
+    symbol_map = {**SYMBOL_TO_COIN_ID, **(symbol_map or {})}
+    known_ids = set(symbol_map.values()) | set(known_ids)
+    keys = {}
+    for column in raw_df.columns:
+        if raw_df[column].notna().any():
+            keys.setdefault(_column_key(column), column)
+    # Setiap kolom hanya dipakai untuk satu field, sesuai urutan COLUMN_ALIASES.
+    # Field teks boleh diisi dari beberapa kolom (mis. 'Asset' kosong -> 'Pair').
+    df = pd.DataFrame(index=raw_df.index)
+    for field, aliases in COLUMN_ALIASES.items():
+        found = [keys.pop(a) for a in aliases if a in keys]
+        if field in ('amount', 'price_per_coin', 'total_cost_usd'):
+            keys.update({_column_key(c): c for c in found[1:]})
+            found = found[:1]
+        df[field] = raw_df[found[0]] if found else np.nan
+        for fallback in found[1:]:
+            df[field] = df[field].fillna(raw_df[fallback])
+
+    dates = _to_date(df['date'])
+    symbols = df['coin'].astype('string').str.strip()
+    coins = _to_coin_id(symbols, symbol_map, known_ids)
+    types = df['type'].astype('string').str.strip().str.lower().map(TRADE_TYPES)
+    amounts = _to_number(df['amount']).abs()
+    prices = _to_number(df['price_per_coin'])
+    totals = _to_number(df['total_cost_usd']).abs()
+    # Kolom yang hilang dilengkapi dari dua kolom lainnya
+    totals = totals.fillna(amounts * prices)
+    prices = prices.fillna(totals / amounts.where(amounts > 0))
+
+    reasons = np.select(
+        [dates.isna(), symbols.isna() | (symbols == ''), coins.isna(), types.isna(), ~(amounts > 0), ~(prices >= 0)],
+        ["invalid date", "missing coin", UNKNOWN_SYMBOL_REASON, "type must be Buy/Sell", "amount must be > 0", "invalid price"],
+        default="",
+    )
+    valid = reasons == ""
+    clean_df = pd.DataFrame({
+        'date': dates.dt.strftime('%Y-%m-%d'),
+        'coin': coins.astype(object),
+        'type': types.astype(object),
+        'amount': amounts,
+        'price_per_coin': prices,
+        'total_cost_usd': totals,
+    })[valid]
+    rejected_df = raw_df[~valid].assign(reason=reasons[~valid])
+    return clean_df, rejected_df
+
+
+def import_trades(client, source, file_name, existing_trades, account_id=DEFAULT_ACCOUNT_ID, symbol_map=None,
+                  table='spot_trades', batch_size=INSERT_BATCH_SIZE, chunk_rows=IMPORT_CHUNK_ROWS, progress=None):
+    """Meng-import semua trade dari `source` ke Supabase, sebagai milik akun `account_id`.
+
+    Duplikat dihitung per kemunculan: dua fill identik di file tetap masuk dua
+    kali, tetapi import ulang file yang sama tidak menambah apa pun;
+    `existing_trades` adalah trade akun yang sama; koin di dalamnya dianggap
+    id yang valid, begitu juga target `symbol_map` (simbol -> id CoinGecko). Insert
+    memakai `returning=minimal`; panggil `TableMirror.sync()` sekali setelahnya.
+    `progress(stats)` dipanggil setelah setiap chunk.
+    """
+    existing_df = pd.DataFrame(existing_trades)
+    existing_counts = trade_fingerprints(existing_df).value_counts()
+    known_ids = set(existing_df['coin']) if 'coin' in existing_df else set()
+    seen_counts = pd.Series(dtype='int64')
+    stats = {'rows': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0}
+    rejected_parts = []
+
+    for raw_df in read_trade_chunks(source, file_name, chunk_rows):
+        with metrics.span("trade_import.normalize"):
+            clean_df, rejected_df = normalize_trades(raw_df, symbol_map, known_ids)
+            fingerprints = trade_fingerprints(clean_df)
+            # Kemunculan ke-n dari sidik jari ini di file, dihitung lintas chunk
+            occurrence = fingerprints.groupby(fingerprints.to_numpy()).cumcount()
+            occurrence += fingerprints.map(seen_counts).fillna(0).astype('int64')
+            duplicate = occurrence < fingerprints.map(existing_counts).fillna(0)
+            seen_counts = seen_counts.add(fingerprints.value_counts(), fill_value=0).astype('int64')
+            new_df = clean_df[~duplicate.to_numpy()]
+            # Lebih cepat daripada to_dict('records') untuk ratusan ribu baris
+            new_rows = [
+                dict(zip(TRADE_COLUMNS, row), account_id=account_id)
+                for row in zip(*(new_df[c].tolist() for c in TRADE_COLUMNS))
+            ]
+
+        for start in range(0, len(new_rows), batch_size):
+            with metrics.span(f"supabase.{table}.insert_batch"):
+                client.table(table).insert(new_rows[start:start + batch_size], returning='minimal').execute()
+            stats['inserted'] += len(new_rows[start:start + batch_size])
+
+        stats['rows'] += len(raw_df)
+        stats['duplicates'] += int(duplicate.sum())
+        stats['rejected'] += len(rejected_df)
+        if len(rejected_df) and sum(len(part) for part in rejected_parts) < MAX_REJECTED_ROWS:
+            rejected_parts.append(rejected_df)
+        if progress is not None:
+            progress(stats)
+
+    metrics.incr("trade_import.rows", stats['rows'])
+    metrics.incr("trade_import.inserted", stats['inserted'])
+    rejected = pd.concat(rejected_parts).head(MAX_REJECTED_ROWS) if rejected_parts else pd.DataFrame()
+    return stats, rejected